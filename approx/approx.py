@@ -1,6 +1,9 @@
 import math
 import numpy as np
 
+from interp import instrument
+from interp.ppoly import PPoly
+
 class CubicBSpline:
     def __init__(self, points):
         # degree
@@ -9,6 +12,9 @@ class CubicBSpline:
             np.array(points), 
             np.full((self.deg,), points[-1])))
         self.n = len(self.points) - self.deg - 1
+        # normal equations accumulated by partial_fit()
+        self.__gram = None
+        self.__rhs = None
 
     def b_spline_value(self, id, x):
         """Calculate b-spline value in point x in section[id]
@@ -31,42 +37,241 @@ class CubicBSpline:
                 buff[i - l + self.deg] = alpha * buff[i - l + self.deg] + (1 - alpha) * buff[i - 1 - l + self.deg]
         return buff[self.deg]
 
-    def fit(self, knots, values):
-        self.m = len(values)
-        # self.n defined
-        A = np.zeros((self.n, self.n))
-        # form A
-        for i in range(self.n):
-            for j in range(self.n):
-                if abs(i - j) <= self.deg:
-                    A[i, j] = sum([self.b_spline_value(i, x) * self.b_spline_value(j, x) for x in knots])
-        # form b
-        b = np.zeros((self.n, ))
-        for j in range(self.n):
-            b[j] = sum([values[i] * self.b_spline_value(j, knots[i]) for i in range(self.m)])
-        # print(A)
-        # print(b)
-        self.alpha = self.__solve(A, b)
+    def fit(self, knots, values, weights=None):
+        """Fit least-squares spline to given values known in knots.
+
+        Keyword arguments:
+        knots -- data points
+        values -- given values
+        weights -- weights of the squared residuals, 1 by default
+        """
+        self.__gram = None
+        return self.partial_fit(knots, values, weights).solve()
+
+    def partial_fit(self, knots, values, weights=None):
+        """Add observations to the normal equations.
+
+        Keyword arguments:
+        knots -- data points of this chunk
+        values -- given values
+        weights -- weights of the squared residuals, 1 by default
+
+        Only the banded normal matrix and the right-hand side are kept, so
+        memory use doesn't depend on the number of observations. Call
+        solve() to update the coefficients, at any time. Observations
+        outside [points[0], points[-1]] are ignored.
+        """
+        clock = instrument.start()
+        knots = np.asarray(knots, dtype=float)
+        values = np.asarray(values, dtype=float)
+        if weights is not None:
+            weights = np.broadcast_to(np.asarray(weights, dtype=float), values.shape)
+        # the basis is zero outside [points[0], points[-1]], so are the
+        # contributions of the observations there
+        inside = (knots >= self.points[0]) & (knots <= self.points[-1])
+        if not inside.all():
+            knots, values = knots[inside], values[inside]
+            if weights is not None:
+                weights = weights[inside]
+        if self.__gram is None:
+            # form banded A, A[i, k] holds the (i, i - k) entry of the normal matrix
+            self.__gram = np.zeros((self.n, self.deg + 1))
+            self.__rhs = np.zeros((self.n, ))
+            self.m = 0
+        self.m += len(values)
+        # each data point has at most deg + 1 nonzero basis functions
+        span, N = self.nonzero_basis(knots)
+        clock = instrument.lap(self, 'fit.basis', clock, len(values))
+        rows = span[:, np.newaxis] + np.arange(-self.deg, 1)
+        wN = N if weights is None else N * weights[:, np.newaxis]
+        for r in range(self.deg + 1):
+            for k in range(r + 1):
+                self.__gram[:, k] += np.bincount(rows[:, r], weights=wN[:, r] * N[:, r - k], minlength=self.n)
+            self.__rhs += np.bincount(rows[:, r], weights=wN[:, r] * values, minlength=self.n)
+        instrument.lap(self, 'fit.rhs', clock, len(values))
+        return self
+
+    def add_normal(self, gram, rhs, m):
+        """Add precomputed terms to the normal equations.
+
+        Keyword arguments:
+        gram -- (n, deg + 1) banded normal matrix, gram[i, k] holds the
+                (i, i - k) entry
+        rhs -- (n, ) right-hand side
+        m -- number of observations the terms come from
+
+        For callers keeping the terms of their observations between fits,
+        partial_fit() computes them from the observations.
+        """
+        if self.__gram is None:
+            self.__gram = np.zeros((self.n, self.deg + 1))
+            self.__rhs = np.zeros((self.n, ))
+            self.m = 0
+        self.__gram += gram
+        self.__rhs += rhs
+        self.m += m
+        return self
+
+    def solve(self):
+        """Compute coefficients from the observations added so far."""
+        clock = instrument.start()
+        self.alpha = self.__solve(self.__gram, self.__rhs)
+        self.__pp = None
+        instrument.lap(self, 'fit.solve', clock, self.m)
         return self
 
     def value(self, x):
-        if (x < self.points[0] or x > self.points[-1]):
-            return 0
-        # return sum([self.alpha[i] * self.b_spline_value(i, x) for i in range(self.n)])
-        j = 0
-        while (j < self.n) and (x >= self.points[j]):
-            j += 1
-        return sum([self.alpha[i] * self.b_spline_value(i, x) for i in range(j - self.deg - 1, j)])
-
-    def basis(self):
-        knots = np.linspace(self.points[0], self.points[-1], 10 * (len(self.points) - self.deg))
-        val = []
-        for i in range(len(self.points) - self.deg - 1):
-            val.append([self.b_spline_value(i, knot) for knot in knots])
-        return knots, val
+        """Compute value in point x or array of points.
 
-    def __solve(self, A, b):
-        """ solves linear matrix equation with coefficient matrix A and values b
+        The approximation is zero outside [points[0], points[-1]]. Values
+        come from the cached piecewise() polynomials, nonzero_basis() gives
+        the basis functions themselves.
+        """
+        clock = instrument.start()
+        x = np.asarray(x, dtype=float)
+        pp = self.piecewise()
+        i = pp.locate(x)
+        clock = instrument.lap(self, 'value.lookup', clock, x.size)
+        t = x - pp.breaks[i]
+        C = pp.C[i]
+        f = C[..., 0] + t * (C[..., 1] + t * (C[..., 2] + t * C[..., 3]))
+        f = np.where((x < self.points[0]) | (x > self.points[-1]), 0.0, f)
+        instrument.lap(self, 'value.evaluate', clock, x.size)
+        return f if f.ndim else float(f)
+
+    def basis(self, x=None):
+        """Compute values of all basis functions.
+
+        Keyword arguments:
+        x -- points, 10 per basis function over [points[0], points[-1]] by default
+
+        Returns x and (n, len(x)) array, row i holds basis function i.
+        nonzero_basis() gives the same values in compact form.
+        """
+        clock = instrument.start()
+        if x is None:
+            x = np.linspace(self.points[0], self.points[-1], 10 * (len(self.points) - self.deg))
+        x = np.asarray(x, dtype=float)
+        span, N = self.nonzero_basis(x)
+        val = np.zeros((self.n, len(x)))
+        val[span[:, np.newaxis] + np.arange(-self.deg, 1), np.arange(len(x))[:, np.newaxis]] = N
+        val[:, (x < self.points[0]) | (x > self.points[-1])] = 0.0
+        instrument.lap(self, 'basis', clock, len(x))
+        return x, val
+
+    def derivative(self, x, order=1):
+        """Compute derivative of given order in point x or array of points.
+
+        The approximation is zero outside [points[0], points[-1]].
+        """
+        x = np.asarray(x, dtype=float)
+        f = np.where((x < self.points[0]) | (x > self.points[-1]), 0.0, self.piecewise().value(x, order))
+        return f if f.ndim else float(f)
+
+    def integrate(self, a, b):
+        """Compute definite integral from a to b, numbers or arrays broadcast together.
+
+        The approximation is zero outside [points[0], points[-1]].
+        """
+        a = np.clip(a, self.points[0], self.points[-1])
+        b = np.clip(b, self.points[0], self.points[-1])
+        f = self.piecewise().integrate(a, b)
+        return f if f.ndim else float(f)
+
+    def state(self):
+        """Return attributes and arrays describing the fitted approximation."""
+        return {'deg': self.deg, 'm': self.m}, {'points': self.points, 'alpha': self.alpha}
+
+    @classmethod
+    def from_state(cls, attrs, arrays):
+        """Create fitted approximation from state(), arrays are used without copying."""
+        spline = cls.__new__(cls)
+        spline.deg = attrs['deg']
+        spline.m = attrs['m']
+        spline.points = arrays['points']
+        spline.alpha = arrays['alpha']
+        spline.n = len(spline.points) - spline.deg - 1
+        spline.__pp = None
+        spline.__gram = None
+        spline.__rhs = None
+        return spline
+
+    def piecewise(self):
+        """Return the approximation as PPoly, polynomials in powers of (x - points[i])."""
+        if self.__pp is None:
+            breaks = np.unique(self.points)
+            span = np.clip(np.searchsorted(self.points, breaks[:-1], side='right') - 1, self.deg, self.n - 1)
+            h = np.diff(breaks)
+            # sample every polynomial in 4 points and solve for the coefficients in u
+            u = np.linspace(0.0, 1.0, 4)
+            x = breaks[:-1, np.newaxis] + h[:, np.newaxis] * u
+            span = np.repeat(span, 4)
+            _, N = self.nonzero_basis(x.ravel(), span)
+            f = np.sum(self.alpha[span[:, np.newaxis] + np.arange(-self.deg, 1)] * N, axis=1).reshape((-1, 4))
+            C = np.linalg.solve(np.vander(u, 4, increasing=True), f.T).T
+            self.__pp = PPoly(breaks, C / h[:, np.newaxis] ** np.arange(4))
+        return self.__pp
+
+    def nonzero_basis(self, x, span=None):
+        """Calculate nonzero b-spline values in points x.
+
+        Returns span indices l and (len(x), deg + 1) array of values of the
+        basis functions l - deg, ..., l. The spans are found unless given.
+        Points outside [points[0], points[-1]] get the first or the last
+        polynomial pieces.
         """
-        return np.linalg.solve(A, b)
+        x = np.asarray(x, dtype=float)
+        if span is None:
+            span = np.clip(np.searchsorted(self.points, x, side='right') - 1, self.deg, self.n - 1)
+        # knots points[l - deg + 1], ..., points[l + deg] of every span
+        P = self.points[span[:, np.newaxis] + np.arange(1 - self.deg, self.deg + 1)].T
+        left = [None] + [x - P[self.deg - j] for j in range(1, self.deg + 1)]
+        right = [None] + [P[self.deg - 1 + j] - x for j in range(1, self.deg + 1)]
+        N = [np.ones(len(x))]
+        # Cox-de Boor recursion for all points at once
+        for j in range(1, self.deg + 1):
+            saved = 0.0
+            for r in range(j):
+                temp = N[r] / (right[r + 1] + left[j - r])
+                N[r] = saved + right[r + 1] * temp
+                saved = left[j - r] * temp
+            N.append(saved)
+        N = np.stack(N, axis=1)
+        return span, N
+
+    def __solve(self, A, b):
+        """ solves linear matrix equation with symmetric banded matrix A and values b
 
+        A[i, k] holds the (i, i - k) entry; banded Cholesky factorization.
+        """
+        n, w = A.shape
+        # rows of floats, the band is too narrow for array operations
+        A = A.tolist()
+        L = [[0.0] * w for _ in range(n)]
+        for i in range(n):
+            Li = L[i]
+            for k in reversed(range(1, min(i, w - 1) + 1)):
+                Lj = L[i - k]
+                s = A[i][k]
+                for q in range(1, min(w - k, i - k + 1)):
+                    s -= Li[k + q] * Lj[q]
+                Li[k] = s / Lj[0]
+            d = A[i][0] - sum(e * e for e in Li[1:])
+            if d <= 0:
+                raise np.linalg.LinAlgError("Matrix is not positive definite")
+            Li[0] = math.sqrt(d)
+        # forward substitution L z = b
+        z = [0.0] * n
+        for i in range(n):
+            s = float(b[i])
+            for k in range(1, min(i, w - 1) + 1):
+                s -= L[i][k] * z[i - k]
+            z[i] = s / L[i][0]
+        # back substitution L^T x = z
+        x = [0.0] * n
+        for i in reversed(range(n)):
+            s = z[i]
+            for k in range(1, min(n - 1 - i, w - 1) + 1):
+                s -= L[i + k][k] * x[i + k]
+            x[i] = s / L[i][0]
+        return np.array(x)
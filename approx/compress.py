@@ -0,0 +1,237 @@
+import numpy as np
+
+from approx.approx import CubicBSpline
+
+# an interval is split only if it holds at least this many observations
+MIN_COUNT = 8
+# a split helps if the error of the halves drops below this share of the
+# error of the interval
+IMPROVEMENT = 0.5
+# residuals look like noise if the mean squared difference of neighbours
+# is at least this share of twice their mean square, 1 for white noise
+WHITE = 0.5
+# coarsening stops after this many single removals in a row broke the bounds
+PATIENCE = 8
+
+
+def compress(knots, values, max_error=None, rms_error=None, max_points=None):
+    """Approximate series with as few basis points as the error bounds allow.
+
+    Keyword arguments:
+    knots -- data points
+    values -- given values
+    max_error -- bound of the maximal absolute residual
+    rms_error -- bound of the root mean square residual
+    max_points -- maximal number of basis points, unlimited by default
+
+    Basis points are inserted at the median observation of every interval
+    whose residuals break a bound, all such intervals at once. The
+    smallest number of points meeting the bounds is then bisected with
+    the points spread evenly over the local error. Points between two
+    intervals within the bounds are removed last, in batches halved on
+    failure and one by one, until PATIENCE single removals in a row
+    break the bounds.
+
+    The normal equations are kept as the terms of every interval, which
+    depend on the 6 nearest points only; a refit recomputes the terms of
+    the intervals around changed points and evaluates the residuals.
+
+    Noise above the bounds or a step in the data can't be fitted by any
+    number of points. An interval is no longer split once a split didn't
+    reduce its error and its residuals look like noise, or once it holds
+    too few observations; the bounds may then be broken, 'met' is False
+    in the report.
+
+    At least 4 distinct knots are required, 2 points are a single cubic.
+
+    Returns the fitted approximation and a dict with 'met', whether the
+    bounds hold, 'points', 'max_error', 'rms_error', 'refits' and 'ratio',
+    the size of knots and values over the size of the model.
+    """
+    if max_error is None and rms_error is None:
+        raise ValueError("max_error or rms_error is required")
+    knots = np.asarray(knots, dtype=float)
+    values = np.asarray(values, dtype=float)
+    order = np.argsort(knots, kind='stable')
+    knots, values = knots[order], values[order]
+    distinct = len(np.unique(knots))
+    if distinct < 4:
+        raise ValueError("compress needs at least 4 distinct knots")
+    refits = [0]
+    # interval terms of the normal equations keyed on the points they depend on
+    terms = {}
+
+    def bounds(points):
+        # first observation and count of every interval, the last one is closed
+        first = np.searchsorted(knots, points[:-1], side='left')
+        end = np.append(first[1:], len(knots))
+        return first, end - first
+
+    def fit(points):
+        refits[0] += 1
+        spline = CubicBSpline(points)
+        # interval s holds basis functions s, ..., s + 3, which depend on
+        # points s - 2, ..., s + 3
+        padded = np.concatenate((np.full(2, points[0]), points, np.full(2, points[-1])))
+        keys = [e.tobytes() for e in np.lib.stride_tricks.sliding_window_view(padded, 6)]
+        missing = np.array([s for s, key in enumerate(keys) if key not in terms], dtype=int)
+        if len(missing):
+            first, count = bounds(points)
+            count = count[missing]
+            # observations of the missing intervals, interval after interval
+            local = np.repeat(np.arange(len(missing)), count)
+            index = np.arange(len(local)) - np.repeat(np.cumsum(count) - count, count) + first[missing][local]
+            _, N = spline.nonzero_basis(knots[index], missing[local] + spline.deg)
+            G = np.zeros((len(missing), 4, 4))
+            R = np.zeros((len(missing), 4))
+            for a in range(4):
+                for b in range(a + 1):
+                    G[:, a, b] = np.bincount(local, weights=N[:, a] * N[:, b], minlength=len(missing))
+                R[:, a] = np.bincount(local, weights=N[:, a] * values[index], minlength=len(missing))
+            for e, s in enumerate(missing):
+                terms[keys[s]] = (G[e], R[e])
+        G = np.array([terms[key][0] for key in keys])
+        R = np.array([terms[key][1] for key in keys])
+        # banded normal matrix, gram[i, k] holds the (i, i - k) entry
+        gram = np.zeros((spline.n, 4))
+        rhs = np.zeros((spline.n, ))
+        for a in range(4):
+            for b in range(a + 1):
+                gram[a : a + len(keys), a - b] += G[:, a, b]
+            rhs[a : a + len(keys)] += R[:, a]
+        spline.add_normal(gram, rhs, len(knots)).solve()
+        return spline, values - spline.value(knots)
+
+    def attempt(points):
+        # fit, or None for points the observations can't determine
+        try:
+            return fit(points)
+        except np.linalg.LinAlgError:
+            return None, None
+
+    def holds(r):
+        return (max_error is None or np.max(np.abs(r)) <= max_error) and \
+            (rms_error is None or np.sqrt(np.mean(r ** 2)) <= rms_error)
+
+    def intervals(points, r):
+        # first observation, count, max and sum of squared residuals of every interval
+        first, count = bounds(points)
+        worst = np.zeros(len(count))
+        squares = np.zeros(len(count))
+        full = count > 0
+        worst[full] = np.maximum.reduceat(np.abs(r), first[full])
+        squares[full] = np.add.reduceat(r ** 2, first[full])
+        return first, count, worst, squares
+
+    def error(count, worst, squares):
+        # error of every interval in the measure of the bound
+        if max_error is not None:
+            return worst
+        return np.sqrt(squares / np.maximum(count, 1))
+
+    def white(first, count, squares, r):
+        # whether neighbouring residuals of every interval are uncorrelated
+        rough = np.concatenate(([0.0], np.cumsum(np.diff(r) ** 2)))
+        pairs = np.maximum(count - 1, 0)
+        rough = rough[first + pairs] - rough[first]
+        return rough * np.maximum(count, 1) >= WHITE * 2 * squares * np.maximum(pairs, 1)
+
+    def failing(count, worst, squares):
+        bad = np.zeros(len(count), dtype=bool)
+        if max_error is not None:
+            bad |= worst > max_error
+        if rms_error is not None:
+            bad |= squares > rms_error ** 2 * np.maximum(count, 1)
+        return bad
+
+    # refine, from a single cubic up to 3 intervals as the observations allow
+    points = np.linspace(knots[0], knots[-1], min(4, distinct - 2))
+    spline, r = fit(points)
+    # intervals whose last split didn't help
+    stalled = np.zeros(len(points) - 1, dtype=bool)
+    while not holds(r):
+        first, count, worst, squares = intervals(points, r)
+        floor = stalled & white(first, count, squares, r)
+        split = np.flatnonzero(failing(count, worst, squares) & (count >= MIN_COUNT) & ~floor)
+        if max_points is not None:
+            # worst intervals first within the budget
+            split = split[np.argsort(-worst[split])][: max(max_points - len(points), 0)]
+        if len(split) == 0:
+            break
+        new = knots[first[split] + count[split] // 2]
+        new = new[(new > points[split]) & (new < points[split + 1])]
+        if len(new) == 0:
+            break
+        before = error(count, worst, squares)
+        was_split = np.zeros(len(points) - 1, dtype=bool)
+        was_split[split] = True
+        old = points
+        points = np.sort(np.concatenate((points, new)))
+        spline, r = fit(points)
+        # compare the halves with the interval they come from
+        parent = np.searchsorted(old, points[:-1], side='right') - 1
+        after = error(*intervals(points, r)[1:])
+        stalled = np.where(was_split[parent], after > IMPROVEMENT * before[parent], stalled[parent])
+
+    # redistribute: the local error is about c h ** 4, so points with
+    # density c ** (1 / 4) share the error evenly; the smallest number of
+    # them meeting the bounds is bisected
+    if holds(r) and len(points) > 4:
+        first, count, worst, squares = intervals(points, r)
+        weight = error(count, worst, squares) ** 0.25
+        weight = weight + 0.01 * np.mean(weight) + np.finfo(float).tiny
+        share = np.concatenate(([0.0], np.cumsum(weight)))
+        refined = points
+        lo, hi = 2, len(points)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            trial, tr = attempt(np.unique(np.interp(np.linspace(0.0, share[-1], mid), share, refined)))
+            if trial is not None and holds(tr):
+                hi = mid
+                points, spline, r = trial.points[trial.deg : -trial.deg], trial, tr
+            else:
+                lo = mid + 1
+
+    # coarsen while the bounds hold
+    kept = set()
+    failures = 0
+    while holds(r) and len(points) > 2 and failures < PATIENCE:
+        first, count, worst, squares = intervals(points, r)
+        good = ~failing(count, worst, squares)
+        # interior points between two intervals within the bounds, best fitting first
+        candidates = np.flatnonzero(good[:-1] & good[1:]) + 1
+        candidates = [i for i in candidates[np.argsort(np.maximum(worst[candidates - 1], worst[candidates]), kind='stable')]
+                      if points[i] not in kept]
+        # no two neighbours, a batch must leave every interval changed once
+        taken = np.zeros(len(points), dtype=bool)
+        batch = []
+        for i in candidates:
+            if not taken[i - 1] and not taken[i + 1]:
+                taken[i] = True
+                batch.append(i)
+        if not batch:
+            break
+        # the batch is halved from the end on failure
+        while True:
+            keep = np.ones(len(points), dtype=bool)
+            keep[batch] = False
+            trial, tr = attempt(points[keep])
+            if trial is not None and holds(tr):
+                points, spline, r = points[keep], trial, tr
+                failures = 0
+                break
+            if len(batch) == 1:
+                kept.add(points[batch[0]])
+                failures += 1
+                break
+            batch = batch[: len(batch) // 2]
+
+    model_bytes = spline.points.nbytes + spline.alpha.nbytes
+    return spline, {
+        'met': bool(holds(r)),
+        'points': len(points),
+        'max_error': float(np.max(np.abs(r))),
+        'rms_error': float(np.sqrt(np.mean(r ** 2))),
+        'refits': refits[0],
+        'ratio': (knots.nbytes + values.nbytes) / model_bytes,
+    }
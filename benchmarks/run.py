@@ -0,0 +1,223 @@
+#!/usr/bin/python3
+#-*- coding: UTF-8 -*-
+
+"""Benchmark fit and value of every interpolator and approximator.
+
+Run from the repository root:
+
+    python -m benchmarks.run --output results.json --baseline benchmarks/baseline.json
+
+Exit status is 1 when a result is slower or less accurate than the baseline,
+or when compress() needs more points than a uniform fit of the same error.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+from numpy import pi
+
+from interp.spline import Spline
+from interp.bezier import Bezier
+from interp.bspline import CubicBSpline
+from approx.approx import CubicBSpline as Approximator
+from approx.compress import compress
+
+QUICK_KNOTS = [10, 100, 1000, 10000]
+QUICK_QUERIES = [1, 100, 10000, 100000]
+FULL_KNOTS = [10, 100, 1000, 10000, 100000, 1000000]
+FULL_QUERIES = [1, 10, 100, 1000, 10000, 100000, 1000000, 10000000]
+# points of the accuracy check, random so that they miss the knots
+ERROR_POINTS = 10000
+
+
+def func(x):
+    return x * np.sin(x) + np.log(x + 1)
+
+
+def dfunc(x):
+    return np.divide(1, (x + 1)) + np.sin(x) + x * np.cos(x)
+
+
+def fit_spline(knots, values):
+    return Spline().fit(knots, values, dfunc(knots[0]), dfunc(knots[-1]))
+
+
+def fit_bezier(knots, values):
+    return Bezier().fit(knots, values, dfunc(knots[0]), dfunc(knots[-1]))
+
+
+def fit_bspline(knots, values):
+    return CubicBSpline().fit(knots, values, dfunc(knots[0]), dfunc(knots[-1]))
+
+
+def fit_approx(knots, values):
+    # basis knots as in gui.py: one per five data points
+    points = np.linspace(knots[0], knots[-1], max(len(knots) // 5, 2))
+    return Approximator(points).fit(knots, values)
+
+
+# name -> fit function
+METHODS = {
+    'spline': fit_spline,
+    'bezier': fit_bezier,
+    'bspline': fit_bspline,
+    'approx': fit_approx,
+}
+
+
+def measure(call, min_time):
+    """Return mean time of call, repeated for at least min_time seconds."""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            call()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / number
+        number = max(2 * number, int(number * min_time / max(elapsed, 1e-9)) + 1)
+
+
+def run(methods, knot_counts, query_counts, min_time=0.2, budget=10.0):
+    """Run benchmark cases, return list of result records.
+
+    Keyword arguments:
+    methods -- method names from METHODS
+    knot_counts -- numbers of knots
+    query_counts -- numbers of query points
+    min_time -- minimal measured time of a case, seconds
+    budget -- cases expected to take longer per call are skipped, seconds
+    """
+    rng = np.random.RandomState(0)
+    check = np.sort(np.random.RandomState(1).uniform(0.0, 8 * pi, ERROR_POINTS))
+    results = []
+    for name in methods:
+        fit = METHODS[name]
+        for n in knot_counts:
+            knots = np.linspace(0.0, 8 * pi, n)
+            values = func(knots)
+            seconds = measure(lambda: fit(knots, values), min_time)
+            model = fit(knots, values)
+            error = model.value(check) - func(check)
+            results.append({
+                'method': name, 'phase': 'fit', 'knots': n, 'queries': 0,
+                'seconds': seconds, 'rate': n / seconds,
+                'max_error': float(np.max(np.abs(error))),
+                'rms_error': float(np.sqrt(np.mean(error ** 2))),
+            })
+            seconds = 0.0
+            previous = 1
+            for q in query_counts:
+                record = {'method': name, 'phase': 'value', 'knots': n, 'queries': q}
+                if seconds * q / previous > budget:
+                    record['skipped'] = True
+                    results.append(record)
+                    continue
+                x = rng.uniform(0.0, 8 * pi, q)
+                seconds = measure(lambda: model.value(x), min_time)
+                previous = q
+                record.update({'seconds': seconds, 'rate': q / seconds})
+                results.append(record)
+    return results
+
+
+def check_compress(n=100000, max_error=1e-3):
+    """Return basis points of compress() and of the smallest uniform fit of the same bound.
+
+    The series, sin(x) + 0.1 sin(7 x) on [0, 100], is equally hard
+    everywhere, so uniform points are close to the best.
+    """
+    x = np.linspace(0.0, 100.0, n)
+    y = np.sin(x) + 0.1 * np.sin(7 * x)
+    points = compress(x, y, max_error=max_error)[1]['points']
+    lo, hi = 2, n // 8
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if np.max(np.abs(y - Approximator(np.linspace(0.0, 100.0, mid)).fit(x, y).value(x))) <= max_error:
+            hi = mid
+        else:
+            lo = mid + 1
+    return points, lo
+
+
+def key(record):
+    return (record['method'], record['phase'], record['knots'], record['queries'])
+
+
+def compare(results, baseline, tolerance):
+    """Return descriptions of results worse than baseline.
+
+    Keyword arguments:
+    results -- result records
+    baseline -- result records to compare with
+    tolerance -- allowed relative slowdown or error growth
+    """
+    base = {key(r): r for r in baseline}
+    regressions = []
+    for r in results:
+        b = base.get(key(r))
+        if b is None or r.get('skipped') or b.get('skipped'):
+            continue
+        name = '%s %s knots=%d queries=%d' % key(r)
+        if r['rate'] < b['rate'] * (1 - tolerance):
+            regressions.append('%s: rate %.4g < baseline %.4g' % (name, r['rate'], b['rate']))
+        if 'max_error' in r and r['max_error'] > b['max_error'] * (1 + tolerance) + 1e-12:
+            regressions.append('%s: max error %.4g > baseline %.4g' % (name, r['max_error'], b['max_error']))
+    return regressions
+
+
+def report(results, out=sys.stdout):
+    out.write('%-8s %-6s %8s %9s %12s %14s %12s\n' % (
+        'method', 'phase', 'knots', 'queries', 'seconds', 'rate, 1/s', 'max error'))
+    for r in results:
+        if r.get('skipped'):
+            out.write('%-8s %-6s %8d %9d %12s\n' % (key(r) + ('skipped', )))
+            continue
+        out.write('%-8s %-6s %8d %9d %12.3e %14.4g %12s\n' % (key(r) + (
+            r['seconds'], r['rate'], '%.3e' % r['max_error'] if 'max_error' in r else '')))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark interpolators and approximators.')
+    parser.add_argument('--full', action='store_true', help='knots up to 10^6, queries up to 10^7')
+    parser.add_argument('--methods', nargs='+', choices=sorted(METHODS), default=list(METHODS))
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimal measured time of a case')
+    parser.add_argument('--budget', type=float, default=10.0, help='skip cases slower than this per call')
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--baseline', help='compare with results stored as JSON')
+    parser.add_argument('--tolerance', type=float, default=0.3, help='allowed relative regression')
+    args = parser.parse_args(argv)
+
+    knot_counts = FULL_KNOTS if args.full else QUICK_KNOTS
+    query_counts = FULL_QUERIES if args.full else QUICK_QUERIES
+    results = run(args.methods, knot_counts, query_counts, args.min_time, args.budget)
+    report(results)
+    regressions = []
+    if 'approx' in args.methods:
+        points, uniform = check_compress()
+        print('compress: %d points, uniform fit of the same max error: %d points' % (points, uniform))
+        if points > uniform:
+            regressions.append('compress: %d points > uniform %d' % (points, uniform))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'machine': platform.machine(),
+                'results': results,
+            }, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions += compare(results, baseline, args.tolerance)
+    for line in regressions:
+        print('REGRESSION ' + line)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,22 +7,89 @@ from matplotlib import style
 
 style.use("ggplot")
 
+import queue
+import threading
 import tkinter
 import tkinter.filedialog
 import tkinter.ttk
 
-import csv
-import time
-
 import numpy as np
 from interp.spline import Spline
 from interp.bspline import CubicBSpline
 from interp.bezier import Bezier
 from approx.approx import CubicBSpline as Approximator
+from interp import instrument, loader, storage
+from interp.cache import FitCache
+
+# curve points evaluated per pixel column or per knot in view
+OVERSAMPLE = 4
+# points evaluated between progress reports and cancellation checks
+CHUNK = 1 << 18
+
+
+class Cancelled(Exception):
+    pass
+
+
+def decimate(x, y, lo, hi, columns):
+    """Reduce points to min and max of y in each pixel column.
+
+    Keyword arguments:
+    x -- sorted points
+    y -- values in x
+    lo, hi -- range of x shown
+    columns -- number of pixel columns
+
+    Returns x, y with at most 2 * columns points, they draw the same
+    picture as the original ones at this resolution.
+    """
+    if len(x) <= 2 * columns:
+        return x, y
+    col = np.clip(((x - lo) / (hi - lo) * columns).astype(np.intp), 0, columns - 1)
+    starts = np.flatnonzero(np.concatenate(([True], col[1:] != col[:-1])))
+    low = np.minimum.reduceat(y, starts)
+    high = np.maximum.reduceat(y, starts)
+    return np.repeat(x[starts], 2), np.stack((low, high), axis=1).ravel()
+
+
+def sample(model, knots, values, lo, hi, columns, progress, cancelled, done=0):
+    """Evaluate model on [lo, hi] for plotting, in chunks.
+
+    Keyword arguments:
+    model -- fitted model
+    knots, values -- data shown with the model
+    lo, hi -- range of x shown
+    columns -- number of pixel columns
+    progress -- called with percent done
+    cancelled -- threading.Event, Cancelled is raised when it is set
+    done -- percent done before the evaluation
+
+    Returns decimated (x, y) of the curve, of the knots and of the Bezier
+    control points (None for other models).
+    """
+    inside = (knots >= lo) & (knots <= hi)
+    count = OVERSAMPLE * max(columns, np.count_nonzero(inside))
+    x = np.linspace(lo, hi, count)
+    y = np.empty(count)
+    for i in range(0, count, CHUNK):
+        if cancelled.is_set():
+            raise Cancelled()
+        y[i : i + CHUNK] = model.value(x[i : i + CHUNK])
+        progress(done + (100 - done) * min(i + CHUNK, count) / count)
+    controls = None
+    if isinstance(model, Bezier):
+        # control points of every segment, Bernstein coefficients without binomial factors
+        cx = (model.knots[:-1, np.newaxis] + model.h[:, np.newaxis] * np.arange(4) / 3).ravel()
+        cy = (model.A / np.array([1, 3, 3, 1])).ravel()
+        shown = (cx >= lo) & (cx <= hi)
+        controls = decimate(cx[shown], cy[shown], lo, hi, columns)
+    return decimate(x, y, lo, hi, columns), decimate(knots[inside], values[inside], lo, hi, columns), controls
+
 
 class Preferences(tkinter.Frame):
     def __init__(self, master):
         tkinter.Frame.__init__(self, master=master)
+        instrument.enable()
         self.paramVar = tkinter.IntVar(master=master)
         self.delimVar = tkinter.StringVar(master=master)
 
@@ -62,6 +129,16 @@ class Preferences(tkinter.Frame):
             self.paramFrame, text='Построить', command=self.calculate_and_show, state=tkinter.DISABLED)
         self.paramShowCfBtn = tkinter.Button(
             self.paramFrame, text='Коэффициенты', command=self.show_coefficient, state=tkinter.DISABLED)
+        self.progressBar = tkinter.ttk.Progressbar(self.paramFrame, maximum=100)
+        self.cancelBtn = tkinter.Button(
+            self.paramFrame, text='Отмена', command=self.cancel, state=tkinter.DISABLED)
+        # background work, see start_worker
+        self.cancelled = threading.Event()
+        # plotted model and curve lines of every axes
+        self.plots = {}
+        self.zoomJob = None
+        # building the same model again is a lookup
+        self.cache = FitCache()
 
         # calculated values table's frame
         self.tableFrame = tkinter.Frame(self.leftFrame)
@@ -98,6 +175,8 @@ class Preferences(tkinter.Frame):
         self.paramDSecondEntry.pack()
         self.paramComputeBtn.pack()
         self.paramShowCfBtn.pack()
+        self.progressBar.pack()
+        self.cancelBtn.pack()
         # pack into frame table's widgets
         self.timeLabel.pack()
         self.tableTree.pack()
@@ -124,15 +203,11 @@ class Preferences(tkinter.Frame):
 
 
     def load_file(self):
-        self.knots = []
-        self.values = []
-
         csvfile = tkinter.filedialog.askopenfile()
         if csvfile is not None:
-            reader = csv.DictReader(csvfile, delimiter=self.delimVar.get(), fieldnames=('knot', 'value'))
-            for row in reader:
-                self.knots.append(float(row['knot']))
-                self.values.append(float(row['value']))
+            data = loader.load(csvfile.name, delimiter=self.delimVar.get(), usecols=(0, 1))
+            self.knots = data[:, 0]
+            self.values = data[:, 1]
             self.paramComputeBtn.config(state=tkinter.NORMAL)
             self.tableAddBtn.config(state=tkinter.DISABLED)
             self.fileLabel.config(text=csvfile.name)
@@ -147,29 +222,18 @@ class Preferences(tkinter.Frame):
             self.calculate_and_show_approx()
 
     def calculate_and_show_approx(self):
-        points = np.linspace(min(self.knots), max(self.knots), len(self.knots) / 5)
-        spline = Approximator(points)
-        
-        first_time = time.perf_counter()
-        spline = spline.fit(self.knots, self.values)
-        elapsed_time = time.perf_counter() - first_time
-        
-        x_list = np.linspace(min(self.knots), max(self.knots), len(self.knots) * 5)
-        values_time_start = time.perf_counter()
-        y_list = [spline.value(x) for x in x_list]
-        values_time = time.perf_counter() - values_time_start
-        self.paramShowCfBtn.config(state=tkinter.NORMAL)
-        self.tableAddBtn.config(state=tkinter.NORMAL)
-        self.approxAx.clear()
-        draw_time_start = time.perf_counter()
-        self.approxAx.plot(x_list, y_list)
-        self.approxAx.plot(self.knots, self.values, 'bo')
-        self.approxCanvas.draw()
-        draw_time = time.perf_counter() - draw_time_start
-        self.timeLabel.config(text='Время расчетов коэффициентов: %f с\n \
-            Время расчета значений: %f с\n \
-            Отрисовка графика: %f с' % (elapsed_time, values_time, draw_time))
+        points = np.linspace(min(self.knots), max(self.knots), max(len(self.knots) // 5, 2))
+        knots, values, cache = self.knots, self.values, self.cache
+        columns = self.columns(self.approxAx)
 
+        def job(progress, cancelled):
+            instrument.reset()
+            spline = cache.fit(Approximator(points), knots, values)
+            progress(30)
+            lo, hi = knots.min(), knots.max()
+            return spline, sample(spline, knots, values, lo, hi, columns, progress, cancelled, 30)
+
+        self.start_worker(job, lambda result: self.show(self.approxAx, self.approxCanvas, *result))
 
     def calculate_and_show_interp(self):
         self.d = [
@@ -178,35 +242,145 @@ class Preferences(tkinter.Frame):
         ]
         if self.paramVar.get() == 1:
             # spline
-            self.spl = Spline()
+            cls = Spline
         elif self.paramVar.get() == 2:
             # bezier
-            self.spl = Bezier()
+            cls = Bezier
         else:
             # bspline
-            self.spl = CubicBSpline()
-
-        first_time = time.perf_counter()
-        self.spl = self.spl.fit(self.knots, self.values, self.d[0], self.d[-1])
-        elapsed_time = time.perf_counter() - first_time
-        x_list = np.linspace(min(self.knots), max(self.knots), len(self.knots) * 5)
-        values_time_start = time.perf_counter()
-        y_list = [self.spl.value(x) for x in x_list]
-        values_time = time.perf_counter() - values_time_start
+            cls = CubicBSpline
+        knots, values, d, cache = self.knots, self.values, self.d, self.cache
+        columns = self.columns(self.ax)
+
+        def job(progress, cancelled):
+            instrument.reset()
+            spl = cache.fit(cls(), knots, values, d[0], d[-1])
+            progress(30)
+            lo, hi = knots.min(), knots.max()
+            return spl, sample(spl, knots, values, lo, hi, columns, progress, cancelled, 30)
+
+        def done(result):
+            self.spl = result[0]
+            self.show(self.ax, self.canvas, *result)
+
+        self.start_worker(job, done)
+
+    def columns(self, ax):
+        """Return width of axes in pixels."""
+        return max(int(ax.bbox.width), 1)
+
+    def start_worker(self, job, done):
+        """Run job(progress, cancelled) on a background thread.
+
+        Running work is cancelled first. The progress bar follows
+        progress(percent) calls, done(result) is called on the Tk thread
+        when the job returns.
+        """
+        self.cancel()
+        self.cancelled = cancelled = threading.Event()
+        messages = queue.Queue()
+
+        def run():
+            try:
+                result = job(lambda percent: messages.put(('progress', percent)), cancelled)
+            except Cancelled:
+                messages.put(('cancelled', None))
+            except Exception as e:
+                messages.put(('error', e))
+            else:
+                messages.put(('done', result))
+
+        self.progressBar['value'] = 0
+        self.cancelBtn.config(state=tkinter.NORMAL)
+        threading.Thread(target=run, daemon=True).start()
+        self.poll(messages, cancelled, done)
+
+    def poll(self, messages, cancelled, done):
+        while True:
+            try:
+                kind, data = messages.get_nowait()
+            except queue.Empty:
+                self.after(50, self.poll, messages, cancelled, done)
+                return
+            if cancelled is not self.cancelled:
+                # superseded job, wait for its thread to finish quietly
+                if kind == 'progress':
+                    continue
+                return
+            if kind == 'progress':
+                self.progressBar['value'] = data
+                continue
+            self.cancelBtn.config(state=tkinter.DISABLED)
+            if kind == 'done' and not cancelled.is_set():
+                done(data)
+            elif kind == 'error':
+                self.fileLabel.config(text='Ошибка: %s' % data)
+            else:
+                self.progressBar['value'] = 0
+            return
+
+    def cancel(self):
+        self.cancelled.set()
+        self.cancelBtn.config(state=tkinter.DISABLED)
+
+    def show(self, ax, canvas, model, lines):
+        """Plot model fitted in the background, lines are from sample()."""
+        (x, y), (kx, ky), controls = lines
         self.paramShowCfBtn.config(state=tkinter.NORMAL)
         self.tableAddBtn.config(state=tkinter.NORMAL)
-        self.ax.clear()
-        draw_time_start = time.perf_counter()
-        self.ax.plot(x_list, y_list)
-        self.ax.plot(self.knots, self.values, 'bo')
-        if isinstance(self.spl, Bezier):
-            for lst in self.spl.A:
-                self.ax.plot(lst, [self.spl.value(x) for x in lst], 'ro')
-        self.canvas.draw()
-        draw_time = time.perf_counter() - draw_time_start
+        clock = instrument.start()
+        ax.clear()
+        plot = {'model': model, 'canvas': canvas}
+        plot['curve'], = ax.plot(x, y)
+        plot['knots'], = ax.plot(kx, ky, 'bo')
+        if controls is not None:
+            plot['controls'], = ax.plot(*controls, 'ro')
+        self.plots[ax] = plot
+        # the first draw autoscales the limits, connect after it: clear()
+        # dropped the callbacks and the curve is sampled for this range
+        canvas.draw()
+        plot['range'] = ax.get_xlim()
+        ax.callbacks.connect('xlim_changed', self.zoomed)
+        instrument.lap('gui', 'draw', clock)
+        self.show_time()
+
+    def zoomed(self, ax):
+        # the toolbar changes limits many times while panning, wait for it to stop
+        if self.zoomJob is not None:
+            self.after_cancel(self.zoomJob)
+        self.zoomJob = self.after(100, self.resample, ax)
+
+    def resample(self, ax):
+        """Evaluate the plotted model again in the shown range."""
+        self.zoomJob = None
+        plot = self.plots[ax]
+        model, knots, values = plot['model'], self.knots, self.values
+        lo, hi = ax.get_xlim()
+        if plot['range'] == (lo, hi):
+            return
+        plot['range'] = (lo, hi)
+        columns = self.columns(ax)
+
+        def job(progress, cancelled):
+            return sample(model, knots, values, lo, hi, columns, progress, cancelled)
+
+        def done(lines):
+            clock = instrument.start()
+            (x, y), (kx, ky), controls = lines
+            plot['curve'].set_data(x, y)
+            plot['knots'].set_data(kx, ky)
+            if controls is not None:
+                plot['controls'].set_data(*controls)
+            plot['canvas'].draw_idle()
+            instrument.lap('gui', 'draw', clock)
+
+        self.start_worker(job, done)
+
+    def show_time(self):
         self.timeLabel.config(text='Время расчетов коэффициентов: %f с\n \
             Время расчета значений: %f с\n \
-            Отрисовка графика: %f с' % (elapsed_time, values_time, draw_time))
+            Отрисовка графика: %f с' % (
+                instrument.total('fit'), instrument.total('value'), instrument.total('draw')))
 
 
     def calculate_at(self):
@@ -224,7 +398,11 @@ class Preferences(tkinter.Frame):
             self.tableTree.insert('', 0, text=str(x), values=(str(y), t))
 
     def show_coefficient(self):
-        with tkinter.filedialog.asksaveasfile() as file:
+        with tkinter.filedialog.asksaveasfile(filetypes=(('Text', '*.txt'), ('Model', '*.model'))) as file:
+            if file.name.endswith('.model'):
+                # binary model, loaded back with storage.load
+                storage.save(self.spl, file.name)
+                return
             if isinstance(self.spl, Spline):
                 t = 'Cubic spline'
             elif isinstance(self.spl, Bezier):
@@ -232,7 +410,7 @@ class Preferences(tkinter.Frame):
             elif isinstance(self.spl, CubicBSpline):
                 t = 'Cubic B Spline'
             x = self.spl.A
-            np.savetxt(fname=file.name, X=x, fmt='%10.5f', header=t)
+            np.savetxt(fname=file.name, X=x, fmt='%24.17g', header=t)
         
 
 if __name__ == '__main__':
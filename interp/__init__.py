@@ -0,0 +1,8 @@
+#!/usr/bin/python3
+#-*- coding: UTF-8 -*-
+
+from .spline import Spline
+from .bezier import Bezier
+from .bspline import CubicBSpline
+
+__all__ = ['Spline', 'Bezier', 'CubicBSpline']
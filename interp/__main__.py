@@ -0,0 +1,118 @@
+#!/usr/bin/python3
+#-*- coding: UTF-8 -*-
+
+"""Fit knot/value records from a file or stdin and write values or coefficients.
+
+    python -m interp spline data.dat --grid 0 100 1001 > values.dat
+    cat data.dat | python -m interp approx - --points 200 --output approx.model
+
+Records hold the knot in the first of --usecols and the values of one or
+more series in the others, approx takes one series. Without --grid or --at the coefficients are
+written, as text or as a binary model for an --output ending with .model.
+"""
+
+import argparse
+import io
+import sys
+
+import numpy as np
+
+from . import loader, storage
+from .spline import Spline
+from .bezier import Bezier
+from .bspline import CubicBSpline
+
+METHODS = ('spline', 'bezier', 'bspline', 'approx')
+
+
+def iter_records(path, delimiter, usecols, chunk_size):
+    """Yield (rows, columns) arrays of records of the file, '-' for stdin."""
+    if path != '-':
+        for chunk in loader.iter_chunks(path, delimiter, usecols, chunk_size):
+            yield chunk
+        return
+    while True:
+        lines = sys.stdin.buffer.readlines(chunk_size)
+        if not lines:
+            return
+        yield np.loadtxt(io.BytesIO(b''.join(lines)), delimiter=delimiter, usecols=usecols, ndmin=2)
+
+
+def fit(args, chunks):
+    """Fit model of args.method to the records."""
+    if args.method == 'approx':
+        from approx.approx import CubicBSpline as Approximator
+        if args.range is not None:
+            # basis known in advance, the records are streamed
+            model = Approximator(np.linspace(args.range[0], args.range[1], args.points))
+            for chunk in chunks:
+                model.partial_fit(chunk[:, 0], chunk[:, 1])
+            return model.solve()
+    data = np.concatenate(list(chunks))
+    knots = data[:, 0]
+    values = data[:, 1] if data.shape[1] == 2 else data[:, 1:]
+    if args.method == 'approx':
+        return Approximator(np.linspace(knots.min(), knots.max(), args.points)).fit(knots, values)
+    cls = {'spline': Spline, 'bezier': Bezier, 'bspline': CubicBSpline}[args.method]
+    return cls().fit(knots, values, args.d0, args.dn)
+
+
+def write(output, x, f):
+    """Write points and values as text."""
+    if f.ndim == 1:
+        f = f[:, np.newaxis]
+    np.savetxt(output, np.column_stack((x, f)), fmt='%.17g')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m interp', description='Fit knot/value records.')
+    parser.add_argument('method', choices=METHODS)
+    parser.add_argument('input', nargs='?', default='-', help="records file, '-' for stdin")
+    parser.add_argument('--delimiter', help='field separator, whitespace by default')
+    parser.add_argument('--usecols', default='0,1', help='knot column and value columns')
+    parser.add_argument('--chunk-size', type=int, default=1 << 22, help='bytes read at once')
+    parser.add_argument('--d0', type=float, default=0.0, help='derivative in the first knot')
+    parser.add_argument('--dn', type=float, default=0.0, help='derivative in the last knot')
+    parser.add_argument('--points', type=int, default=100, help='basis knots of approx')
+    parser.add_argument('--range', type=float, nargs=2, metavar=('LO', 'HI'),
+                        help='interval of approx basis knots, records are then streamed')
+    parser.add_argument('--grid', nargs=3, metavar=('START', 'STOP', 'NUM'), help='write values on uniform grid')
+    parser.add_argument('--at', help='write values in points from text or .npy file')
+    parser.add_argument('--output', help='output file, stdout by default; .npy for values, .model for coefficients')
+    args = parser.parse_args(argv)
+
+    usecols = [int(c) for c in args.usecols.split(',')]
+    if args.method == 'approx' and len(usecols) > 2:
+        parser.error('approx fits one series, give one value column in --usecols')
+    delimiter = None if args.delimiter is None or args.delimiter.isspace() else args.delimiter
+    model = fit(args, iter_records(args.input, delimiter, usecols, args.chunk_size))
+    output = args.output or sys.stdout.buffer
+
+    if args.grid is not None or args.at is not None:
+        if args.grid is not None:
+            x = (float(args.grid[0]), float(args.grid[1]), int(args.grid[2]))
+        elif args.at.endswith('.npy'):
+            x = np.load(args.at, mmap_mode='r')
+        else:
+            x = loader.load(args.at, delimiter, (0, ))[:, 0]
+        if args.output is not None and args.output.endswith('.npy'):
+            # out of core: evaluated chunk by chunk into a memory map
+            from .resample import evaluate
+            evaluate(model, x, args.output)
+            return 0
+        if isinstance(x, tuple):
+            x = np.linspace(*x)
+        write(output, x, model.value(np.asarray(x)))
+        return 0
+
+    if args.output is not None and args.output.endswith('.model'):
+        storage.save(model, args.output)
+        return 0
+    attrs, arrays = model.state()
+    coefficients = arrays.get('A', arrays.get('alpha'))
+    np.savetxt(output, coefficients.reshape((len(coefficients), -1)), fmt='%24.17g', header=type(model).__name__)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
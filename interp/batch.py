@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+#-*- coding: UTF-8 -*-
+
+import mmap
+import multiprocessing
+import os
+import threading
+
+import numpy as np
+
+from .spline import Spline
+from .bezier import Bezier
+from .bspline import CubicBSpline
+
+METHODS = ('spline', 'bezier', 'bspline', 'approx')
+# array offsets in the shared block are multiples of ALIGN bytes
+ALIGN = 64
+
+# jobs of the running fit_many, inherited by forked workers
+_method = None
+_jobs = None
+_layout = None
+_out = None
+_lock = threading.Lock()
+
+
+def _model(method):
+    if method == 'approx':
+        # imported here, approx depends on this package
+        from approx.approx import CubicBSpline as Approximator
+        return Approximator
+    return {'spline': Spline, 'bezier': Bezier, 'bspline': CubicBSpline}[method]
+
+
+def _fit(method, job):
+    if method == 'approx':
+        points, knots, values = job
+        return _model(method)(points).fit(knots, values)
+    knots, values, d0, dn = job
+    return _model(method)().fit(knots, values, d0, dn)
+
+
+def _shapes(method, job):
+    # shapes of the arrays of state() of the fitted model
+    if method == 'approx':
+        points = len(job[0]) + 6
+        return {'points': (points, ), 'alpha': (points - 4, )}
+    n = len(job[0])
+    tail = np.shape(job[1])[1:]
+    if method == 'spline':
+        return {'knots': (n, ), 'A': (n - 1, 4) + tail}
+    if method == 'bezier':
+        return {'knots': (n, ), 'h': (n - 1, ), 'A': (n - 1, 4) + tail}
+    return {'knots': (n, ), 'A': (n + 2, ) + tail}
+
+
+def _fit_range(bounds):
+    # fit jobs start..stop-1, write their arrays into the shared block
+    attrs = []
+    for i in range(*bounds):
+        a, arrays = _fit(_method, _jobs[i]).state()
+        for name, (offset, shape) in _layout[i].items():
+            np.ndarray(shape, dtype=float, buffer=_out, offset=offset)[...] = arrays[name]
+        attrs.append(a)
+    return attrs
+
+
+def fit_many(method, jobs, processes=None, chunksize=64):
+    """Fit many independent series in a process pool.
+
+    Keyword arguments:
+    method -- 'spline', 'bezier', 'bspline' or 'approx'
+    jobs -- iterable of (knots, values, d0, dn), or of (points, knots, values)
+            for 'approx'
+    processes -- number of worker processes, os.cpu_count() by default
+    chunksize -- jobs sent to a worker at once
+
+    Returns list of fitted models. Workers are forked, so they read the jobs
+    from the inherited memory, and write the coefficients into one shared
+    anonymous memory block which backs the arrays of all returned models;
+    only small attribute dicts are sent back. Without fork (or with one
+    process) the jobs are fitted in this process.
+    """
+    global _method, _jobs, _layout, _out
+    if method not in METHODS:
+        raise ValueError("method must be one of %s" % ', '.join(METHODS))
+    jobs = list(jobs)
+    # place the arrays of every model in one block
+    layout = []
+    offset = 0
+    for job in jobs:
+        arrays = {}
+        for name, shape in _shapes(method, job).items():
+            arrays[name] = (offset, shape)
+            offset += (int(np.prod(shape)) * 8 + ALIGN - 1) // ALIGN * ALIGN
+        layout.append(arrays)
+    out = mmap.mmap(-1, max(offset, 1))
+    processes = processes or os.cpu_count() or 1
+    try:
+        context = multiprocessing.get_context('fork')
+    except ValueError:
+        context = None
+    bounds = [(i, min(i + chunksize, len(jobs))) for i in range(0, len(jobs), chunksize)]
+    with _lock:
+        _method, _jobs, _layout, _out = method, jobs, layout, out
+        try:
+            if context is None or processes == 1 or len(bounds) < 2:
+                attrs = [_fit_range(b) for b in bounds]
+            else:
+                with context.Pool(min(processes, len(bounds))) as pool:
+                    attrs = pool.map(_fit_range, bounds)
+        finally:
+            _method = _jobs = _layout = _out = None
+    cls = _model(method)
+    models = []
+    for a, arrays in zip([a for chunk in attrs for a in chunk], layout):
+        arrays = {
+            name: np.ndarray(shape, dtype=float, buffer=out, offset=offset)
+            for name, (offset, shape) in arrays.items()
+        }
+        models.append(cls.from_state(a, arrays))
+    return models
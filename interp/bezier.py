@@ -4,89 +4,193 @@
 import numpy as np
 from numpy import pi
 
+from . import instrument
+from .ppoly import PPoly, check_periodic, restrict, wrap
+from .tdma import factorize
+
 
 class Bezier:
     def __init__(self):
-        pass
+        self.periodic = False
 
-    def fit(self, knots, values, d0, dn):
+    def fit(self, knots, values, d0=None, dn=None, periodic=False):
         """Fit spline to given values known in knots.
 
         Keyword arguments:
-        knots -- knots
-        values -- given values
-        d0 -- derivative in knots[0]
-        dn -- derivative in knots[n]
+        knots -- knots, strictly increasing, spacing may be non-uniform
+        values -- given values, (n, ) or (n, k) for k series on the same knots
+        d0 -- derivative in knots[0], number or k numbers
+        dn -- derivative in knots[n], number or k numbers
+        periodic -- instead of d0 and dn, continue the spline with period
+                    knots[n] - knots[0]; values[n] must equal values[0]
         """
-        self.knots = knots
-        self.h = knots[1] - knots[0]
-        self.n = len(knots)
-        # form the known-values vector Y
-        Y = np.zeros((self.n))
-        Y[0] = d0
-        Y[1 : self.n - 1] = [3.0 * (values[i + 2] - values[i]) for i in range(self.n - 2)]
-        Y[self.n - 1] = dn
-        # compute the derivatives vector D with Tridiagonal Matrix Algorithm
-        D = self.__solve(Y)
-        # Control Points
-        self.A = np.zeros((self.n, 4))
-        for i in range(self.n - 1):
-            self.A[i][0] = values[i]
-            self.A[i][1] = D[i] + 3 * values[i]
-            self.A[i][2] = 3 * values[i + 1] - D[i + 1]
-            self.A[i][3] = values[i + 1]
+        clock = instrument.start()
+        self.knots = np.array(knots, dtype=float)
+        values = np.array(values, dtype=float)
+        self.n = len(self.knots)
+        # segment widths
+        self.h = np.diff(self.knots)
+        if np.any(self.h <= 0):
+            raise ValueError("knots must be strictly increasing")
+        # segment widths broadcast against the series
+        h = self.h.reshape((-1, ) + (1, ) * (values.ndim - 1))
+        delta = np.diff(values, axis=0) / h
+        self.periodic = periodic
+        if periodic:
+            check_periodic(values)
+            # D[n] = D[0]: row i couples segments i - 1 and i cyclically
+            prev, hp, dp = np.roll(self.h, 1), np.roll(h, 1, axis=0), np.roll(delta, 1, axis=0)
+            Y = 3.0 * (h * dp + hp * delta)
+            clock = instrument.lap(self, 'fit.rhs', clock, self.n)
+            D = factorize(self.h, 2.0 * (prev + self.h), prev, cyclic=True).solve(Y)
+            D = np.concatenate((D, D[:1]))
+        elif d0 is None or dn is None:
+            raise ValueError("d0 and dn are required unless periodic")
+        else:
+            # form the tridiagonal system a[i] D[i - 1] + b[i] D[i] + c[i] D[i + 1] = Y[i]
+            a = np.zeros((self.n))
+            b = np.ones((self.n))
+            c = np.zeros((self.n))
+            Y = np.zeros(values.shape)
+            a[1 : self.n - 1] = self.h[1:]
+            b[1 : self.n - 1] = 2.0 * (self.h[:-1] + self.h[1:])
+            c[1 : self.n - 1] = self.h[:-1]
+            Y[0] = d0
+            Y[1 : self.n - 1] = 3.0 * (h[1:] * delta[:-1] + h[:-1] * delta[1:])
+            Y[self.n - 1] = dn
+            clock = instrument.lap(self, 'fit.rhs', clock, self.n)
+            # compute the derivatives vector D with Tridiagonal Matrix Algorithm,
+            # the matrix depends on the knot spacing and isn't cached
+            D = factorize(a, b, c).solve(Y)
+        clock = instrument.lap(self, 'fit.solve', clock, self.n)
+        # Control Points, scaled by the Bernstein binomial coefficients
+        self.A = np.stack((
+            values[:-1],
+            3 * values[:-1] + h * D[:-1],
+            3 * values[1:] - h * D[1:],
+            values[1:],
+        ), axis=1)
+        self.__pp = None
+        instrument.lap(self, 'fit.coefficients', clock, self.n)
         return self
 
     def value(self, x):
         """Compute value in given knot.
 
         Keyword arguments:
-        knot -- given knot, must be in interval [x[0], ..., x[n]]
+        x -- given knot, must be in interval [x[0], ..., x[n]];
+             may also be an array of knots of any shape
+
+        For an array the result is an ndarray of the same shape with nan
+        in place of the knots outside the interval. A spline fitted to k
+        series gives k values per knot, stacked along the last axis. A
+        periodic spline takes any knot, wrapped into the period.
+        """
+        clock = instrument.start()
+        x = np.asarray(x, dtype=float)
+        if self.periodic:
+            x = wrap(x, self.knots[0], self.knots[-1])[1]
+        i = np.clip(np.searchsorted(self.knots, x) - 1, 0, self.n - 2)
+        clock = instrument.lap(self, 'value.lookup', clock, x.size)
+        t = (x - self.knots[i]) / self.h[i]
+        if self.A.ndim == 3:
+            t = t[..., np.newaxis]
+        s = 1 - t
+        # Bernstein weights for all points at once
+        f = s * s * (s * self.A[i, 0] + t * self.A[i, 1]) + t * t * (s * self.A[i, 2] + t * self.A[i, 3])
+        outside = (x < self.knots[0]) | (x > self.knots[self.n - 1])
+        instrument.lap(self, 'value.evaluate', clock, x.size)
+        if x.ndim == 0:
+            return None if outside else (f if f.ndim else float(f))
+        f[outside] = np.nan
+        return f
+
+
+    def derivative(self, x, order=1):
+        """Compute derivative of given order in given knot.
+
+        Keyword arguments:
+        x -- given knot or array of knots, must be in interval [x[0], ..., x[n]]
+             unless the spline is periodic
+        order -- derivative order
         """
-        if (x < self.knots[0]) or (x > self.knots[self.n - 1]):
-            return None
-        i = [j for j in range(len(self.knots)-1) if (x >= self.knots[j] and x <= self.knots[j + 1])][0]
-        t = (x - self.knots[i]) / self.h
-        t_i = np.array([
-            (1 - t) ** 3,
-            ((1 - t) ** 2) * t,
-            (1 - t) * (t ** 2),
-            t ** 3
-        ])
-        return t_i.dot(self.A[i])
-
-    def __solve(self, d):
-        n = len(d)          # eq number
-        x = np.zeros((n, )) # result
-        alpha = np.zeros((n, ))
-        beta = np.zeros((n, ))
-        alpha[1] = 0
-        beta[1] = d[0]
-        # implicit: a = 1, b = 4, c = 1
-        for i in range(2, n):
-            alpha[i] = -1 / (alpha[i - 1] + 4)
-            beta[i] = (d[i - 1] - beta[i - 1]) / (alpha[i - 1] + 4)
-        # explicit eval of last component
-        x[-1] = d[-1]
-        for i in reversed(range(0, n - 1)):
-            x[i] = alpha[i + 1] * x[i + 1] + beta[i + 1]
-
-        return x
+        if self.periodic:
+            f = self.piecewise().value(x, order)
+            return f if f.ndim else float(f)
+        return restrict(self.piecewise().value(x, order), self.knots[0], self.knots[-1], x)
+
+    def integrate(self, a, b):
+        """Compute definite integral from a to b.
+
+        Keyword arguments:
+        a -- lower limit, number or array
+        b -- upper limit, number or array, broadcast with a
+
+        Limits must be in interval [x[0], ..., x[n]] unless the spline is
+        periodic. Integrals over whole segments are summed once, so every
+        query costs a segment search.
+        """
+        if self.periodic:
+            f = self.piecewise().integrate(a, b)
+            return f if f.ndim else float(f)
+        return restrict(self.piecewise().integrate(a, b), self.knots[0], self.knots[-1], a, b)
+
+    def roots(self, level=0.0):
+        """Return all knots x in [x[0], x[n]] where the spline equals level.
+
+        Keyword arguments:
+        level -- value to cross, e.g. a threshold
+
+        Returns sorted array, or list of arrays for k series. Each segment
+        cubic is solved in closed form, segments whose coefficient bounds
+        exclude the level are skipped.
+        """
+        return self.piecewise().roots(level)
+
+    def state(self):
+        """Return attributes and arrays describing the fitted spline."""
+        return {'periodic': self.periodic}, {'knots': self.knots, 'h': self.h, 'A': self.A}
+
+    @classmethod
+    def from_state(cls, attrs, arrays):
+        """Create fitted spline from state(), arrays are used without copying."""
+        spline = cls()
+        spline.knots = arrays['knots']
+        spline.h = arrays['h']
+        spline.A = arrays['A']
+        spline.n = len(spline.knots)
+        spline.periodic = attrs.get('periodic', False)
+        spline.__pp = None
+        return spline
 
+    def piecewise(self):
+        """Return the spline as PPoly, polynomials in powers of (x - knots[i])."""
+        if self.__pp is None:
+            # Bernstein to power basis in t = (x - knots[i]) / h[i]
+            M = np.array([
+                [1, 0, 0, 0],
+                [-3, 1, 0, 0],
+                [3, -2, 1, 0],
+                [-1, 1, -1, 1],
+            ], dtype=float)
+            C = np.einsum('kq,iq...->ik...', M, self.A)
+            h = self.h.reshape((-1, 1) + (1, ) * (C.ndim - 2))
+            C = C / h ** np.arange(4).reshape((1, 4) + (1, ) * (C.ndim - 2))
+            self.__pp = PPoly(self.knots, C, self.periodic)
+        return self.__pp
 
 if __name__ == "__main__":
     import matplotlib.pyplot as plt
-    from TDMAsolver import TDMAsolver
 
     knots = np.arange(0.0, 8 * pi + 0.1, pi / 4)
     values = knots * np.sin(knots) + np.log(knots + 1)
     d = np.divide(1, (knots + 1)) + np.sin(knots) + knots * np.cos(knots)
     x = np.arange(0.0, 8 * pi, 0.05)
     Bzr = Bezier().fit(knots, values, d[0], d[-1])
-    f = [Bzr.value(e) for e in x]
+    f = Bzr.value(x)
     true_values = x * np.sin(x) + np.log(x + 1)
 
-    SSE = np.sum([(f[i] - true_values[i]) ** 2 for i in range(len(x))])
+    SSE = np.sum((f - true_values) ** 2)
 
     line1, = plt.plot(knots, values, 'ro', label="Заданные значения")
     line2, = plt.plot(x, f, label="Интерполяция")
@@ -1,10 +1,13 @@
 #!/usr/bin/python3
 #-*- coding: UTF-8 -*-
 
-import math
 import numpy as np
 from numpy import pi
 
+from . import instrument
+from .ppoly import PPoly, check_periodic, restrict, wrap
+from .tdma import factorize
+
 
 class CubicBSpline:
     def __init__(self):
@@ -16,6 +19,12 @@ class CubicBSpline:
         ])
         # normalized knots
         self.knots = np.linspace(0.0, 4.0, 5)
+        # local basis: row r holds the coefficients in the fractional offset u
+        # of the basis function weighted by A[j - 3 + r] on segment j
+        binom = np.array([[1, 0, 0, 0], [1, 1, 0, 0], [1, 2, 1, 0], [1, 3, 3, 1]])
+        power = np.clip(np.subtract.outer(np.arange(4), np.arange(4)), 0, None)
+        self.P = np.array([self.T[3 - r].dot(binom * (3 - r) ** power) for r in range(4)])
+        self.periodic = False
 
     def b_spline_value(self, t):
         """Calculate b-spline value in point t
@@ -38,62 +47,158 @@ class CubicBSpline:
         else:
             return self.__base_func0(np.array(points) - i)
 
-    def fit(self, knots, values, d0, dn):
+    def fit(self, knots, values, d0=None, dn=None, periodic=False):
         """Fit spline to given values known in knots.
 
         Keyword arguments:
         knots -- knots
-        values -- given values
-        d0 -- derivative in knots[0]
-        dn -- derivative in knots[n]
+        values -- given values, (n, ) or (n, k) for k series on the same knots
+        d0 -- derivative in knots[0], number or k numbers
+        dn -- derivative in knots[n], number or k numbers
+        periodic -- instead of d0 and dn, continue the spline with period
+                    knots[n] - knots[0]; values[n] must equal values[0]
         """
-        self.knots_x = knots
+        clock = instrument.start()
+        self.knots_x = np.array(knots, dtype=float)
         self.h = self.knots_x[1] - self.knots_x[0]
+        values = np.asarray(values, dtype=float)
+        self.periodic = periodic
+        if periodic:
+            check_periodic(values)
+            # coefficients repeat with period n - 1: A[j] = B[(j - 1) % (n - 1)]
+            # and 6 v[i] = B[i - 1] + 4 B[i] + B[i + 1] cyclically
+            m = len(values) - 1
+            Y = 6 * values[:m]
+            clock = instrument.lap(self, 'fit.rhs', clock, len(knots))
+            ones = np.ones((m, ))
+            B = factorize(ones, 4 * ones, ones, cyclic=True, key=('uniform', m)).solve(Y)
+            self.A = B[(np.arange(m + 3) - 1) % m]
+            self.__pp = None
+            instrument.lap(self, 'fit.solve', clock, len(knots))
+            return self
+        if d0 is None or dn is None:
+            raise ValueError("d0 and dn are required unless periodic")
         # expand knots with additional knots.
         n = len(knots) + 2
         # known-value vector
-        Y = np.zeros((n))
-        Y[0] = d0
-        Y[1 : n - 1] = values[0 : n - 2]
-        Y[n - 1] = dn
+        Y = np.zeros((n, ) + values.shape[1:])
+        Y[0] = 3 * values[0] - self.h * np.asarray(d0, dtype=float)
+        Y[1 : n - 1] = 6 * values
+        Y[n - 1] = 3 * values[-1] + self.h * np.asarray(dn, dtype=float)
+        clock = instrument.lap(self, 'fit.rhs', clock, len(knots))
         # compute the coefficients vector
-        self.A = self.__solve(Y)
+        self.A = self.__tdma(n).solve(Y)
+        self.__pp = None
+        instrument.lap(self, 'fit.solve', clock, len(knots))
         return self
 
     def value(self, x):
         """Compute value in given knot.
 
         Keyword arguments:
-        knot -- given knot, must be in interval [x[0], ..., x[n]]
+        x -- given knot, must be in interval [x[0], ..., x[n]];
+             may also be an array of knots of any shape
+
+        For an array the result is an ndarray of the same shape with nan
+        in place of the knots outside the interval. A spline fitted to k
+        series gives k values per knot, stacked along the last axis. A
+        periodic spline takes any knot, wrapped into the period.
         """
-        if (x < self.knots_x[0]) or (x > self.knots_x[-1]):
-            return None
+        clock = instrument.start()
+        x = np.asarray(x, dtype=float)
+        if self.periodic:
+            x = wrap(x, self.knots_x[0], self.knots_x[-1])[1]
         t = (x - self.knots_x[0]) / self.h + 3
-        start = math.floor(t) - 3
-        end = math.ceil(t)
-        result = 0.0
-        for i in np.arange(start, end):
-            value = self.b_spline_value(t - i)
-            result += self.A[i] * value
-        return result
-
-    def __solve(self, d):
-        n = len(d)          # eq number
-        x = np.zeros((n, )) # result
-        alpha = np.zeros((n, ))
-        beta = np.zeros((n, ))
-        alpha[1] = - 1 / 3
-        beta[1] = -d[0] + 3 * d[1]
-        # implicit: a = 1, b = 4, c = 1
-        for i in range(2, n):
-            alpha[i] = -1 / (alpha[i - 1] + 4)
-            beta[i] = (6 * d[i - 1] - beta[i - 1]) / (alpha[i - 1] + 4)
-        # explicit eval of last component
-        x[-1] = (d[-1] + 3 * d[-2] - 2 * beta[-1]) / (1 + 2 * alpha[-1])
-        for i in reversed(range(0, n - 1)):
-            x[i] = alpha[i + 1] * x[i + 1] + beta[i + 1]
-
-        return x
+        # local segment and fractional offset
+        j = np.clip(np.floor(t).astype(int), 3, len(self.A) - 1)
+        u = t - j
+        clock = instrument.lap(self, 'value.lookup', clock, x.size)
+        # combine the 4 local coefficients with the local basis in one product
+        c = self.A[j[..., np.newaxis] + np.arange(-3, 1)]
+        if self.A.ndim == 2:
+            # several series: put the local coefficients last
+            c = np.swapaxes(c, -1, -2)
+            u = u[..., np.newaxis]
+        c = c.dot(self.P)
+        f = ((c[..., 3] * u + c[..., 2]) * u + c[..., 1]) * u + c[..., 0]
+        outside = (x < self.knots_x[0]) | (x > self.knots_x[-1])
+        instrument.lap(self, 'value.evaluate', clock, x.size)
+        if x.ndim == 0:
+            return None if outside else (f if f.ndim else float(f))
+        f[outside] = np.nan
+        return f
+
+    def derivative(self, x, order=1):
+        """Compute derivative of given order in given knot.
+
+        Keyword arguments:
+        x -- given knot or array of knots, must be in interval [x[0], ..., x[n]]
+             unless the spline is periodic
+        order -- derivative order
+        """
+        if self.periodic:
+            f = self.piecewise().value(x, order)
+            return f if f.ndim else float(f)
+        return restrict(self.piecewise().value(x, order), self.knots_x[0], self.knots_x[-1], x)
+
+    def integrate(self, a, b):
+        """Compute definite integral from a to b.
+
+        Keyword arguments:
+        a -- lower limit, number or array
+        b -- upper limit, number or array, broadcast with a
+
+        Limits must be in interval [x[0], ..., x[n]] unless the spline is
+        periodic. Integrals over whole segments are summed once, so every
+        query costs a segment search.
+        """
+        if self.periodic:
+            f = self.piecewise().integrate(a, b)
+            return f if f.ndim else float(f)
+        return restrict(self.piecewise().integrate(a, b), self.knots_x[0], self.knots_x[-1], a, b)
+
+    def state(self):
+        """Return attributes and arrays describing the fitted spline."""
+        return {'h': float(self.h), 'periodic': self.periodic}, {'knots': self.knots_x, 'A': self.A}
+
+    @classmethod
+    def from_state(cls, attrs, arrays):
+        """Create fitted spline from state(), arrays are used without copying."""
+        spline = cls()
+        spline.h = attrs['h']
+        spline.knots_x = arrays['knots']
+        spline.A = arrays['A']
+        spline.periodic = attrs.get('periodic', False)
+        spline.__pp = None
+        return spline
+
+    def piecewise(self):
+        """Return the spline as PPoly, polynomials in powers of (x - knots[i])."""
+        if self.__pp is None:
+            # the 4 local coefficients of every segment times the local basis
+            c = self.A[np.arange(len(self.knots_x) - 1)[:, np.newaxis] + np.arange(4)]
+            if self.A.ndim == 2:
+                c = np.swapaxes(c, -1, -2)
+            c = c.dot(self.P) / self.h ** np.arange(4)
+            if self.A.ndim == 2:
+                c = np.swapaxes(c, -1, -2)
+            self.__pp = PPoly(self.knots_x, c, self.periodic)
+        return self.__pp
+
+    def __tdma(self, n):
+        # implicit: a = 1, b = 4, c = 1; the derivative conditions
+        # A[2] - A[0] = 2 h d0 and A[n + 1] - A[n - 1] = 2 h dn are folded
+        # into the first and the last rows with the neighbouring equations
+        a = np.ones((n, ))
+        b = np.full((n, ), 4.0)
+        c = np.ones((n, ))
+        a[0] = 0.0
+        b[0] = 1.0
+        c[0] = 2.0
+        a[-1] = 2.0
+        b[-1] = 1.0
+        c[-1] = 0.0
+        return factorize(a, b, c, key=('bspline', n))
 
 
 if __name__ == "__main__":
@@ -105,10 +210,10 @@ if __name__ == "__main__":
     x = np.arange(0.0, 8 * pi, 0.05)
 
     BSp = CubicBSpline().fit(knots, values, d[0], d[-1])
-    f = [BSp.value(e) for e in x]
+    f = BSp.value(x)
     true_values = x * np.sin(x) + np.log(x + 1)
 
-    SSE = np.sum([(f[i] - true_values[i]) ** 2 for i in range(len(x))])
+    SSE = np.sum((f - true_values) ** 2)
 
     line1, = plt.plot(knots, values, 'ro', label="Заданные значения")
     line2, = plt.plot(x, f, label="Интерполяция")
@@ -0,0 +1,113 @@
+#!/usr/bin/python3
+#-*- coding: UTF-8 -*-
+
+import collections
+import hashlib
+import numbers
+import os
+import threading
+
+import numpy as np
+
+from . import storage
+
+
+def _update(digest, value):
+    # numbers, arrays and sequences of numbers by content as floats, so
+    # 0, 0.0 and np.float64(0) are the same argument; anything else by repr
+    if isinstance(value, (numbers.Real, np.number)) and not isinstance(value, (bool, np.bool_)):
+        value = np.asarray(value, dtype=float)
+    if isinstance(value, (np.ndarray, list, tuple)):
+        a = np.ascontiguousarray(value)
+        if a.dtype.kind in 'iuf':
+            a = a.astype(float, copy=False)
+        if a.dtype != object:
+            digest.update(('%s%s' % (a.dtype.str, a.shape)).encode())
+            digest.update(a.data)
+            return
+    digest.update(repr(value).encode())
+
+
+class FitCache:
+    """Fitted models keyed on their inputs.
+
+    A fit with the same model class, constructor state and fit arguments
+    is a lookup. Returned models are shared between callers, they must
+    not be changed (e.g. by Spline.append).
+    """
+    def __init__(self, max_models=256, path=None):
+        """Create empty cache.
+
+        Keyword arguments:
+        max_models -- models kept in memory, the least recently used one is
+                      dropped first
+        path -- directory of the on-disk store, optional; models are saved
+                there with storage and loaded memory-mapped
+        """
+        self.max_models = max_models
+        self.path = path
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.__models = collections.OrderedDict()
+        self.__lock = threading.Lock()
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def key(self, model, *args, **kwargs):
+        """Return hash of model class, its constructor state and fit arguments."""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update((type(model).__module__ + '.' + type(model).__name__).encode())
+        for name, value in sorted(vars(model).items()):
+            digest.update(name.encode())
+            _update(digest, value)
+        for value in args:
+            _update(digest, value)
+        for name, value in sorted(kwargs.items()):
+            digest.update(name.encode())
+            _update(digest, value)
+        return digest.hexdigest()
+
+    def fit(self, model, *args, **kwargs):
+        """Return model.fit(*args, **kwargs), fitted before if possible.
+
+        Keyword arguments:
+        model -- unfitted model, e.g. Spline() or approximation with its points
+        args, kwargs -- arguments of fit
+        """
+        key = self.key(model, *args, **kwargs)
+        with self.__lock:
+            fitted = self.__models.get(key)
+            if fitted is not None:
+                self.__models.move_to_end(key)
+                self.hits += 1
+                return fitted
+        name = None if self.path is None else os.path.join(self.path, key + '.model')
+        if name is not None and os.path.exists(name):
+            fitted = storage.load(name)
+            with self.__lock:
+                self.disk_hits += 1
+        else:
+            fitted = model.fit(*args, **kwargs)
+            with self.__lock:
+                self.misses += 1
+            if name is not None:
+                # write and rename, so readers never see a partial file
+                storage.save(fitted, name + '.tmp%d' % threading.get_ident())
+                os.replace(name + '.tmp%d' % threading.get_ident(), name)
+        with self.__lock:
+            self.__models[key] = fitted
+            self.__models.move_to_end(key)
+            while len(self.__models) > self.max_models:
+                self.__models.popitem(last=False)
+        return fitted
+
+    def stats(self):
+        """Return dict of counters and number of models in memory."""
+        with self.__lock:
+            return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses, 'models': len(self.__models)}
+
+    def clear(self):
+        """Drop models in memory, the on-disk store is kept."""
+        with self.__lock:
+            self.__models.clear()
@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+#-*- coding: UTF-8 -*-
+
+import sys
+
+import numpy as np
+
+from . import instrument
+from .ppoly import restrict
+
+
+class CompactModel:
+    """Fitted model reduced to its polynomial coefficients.
+
+    C[i] holds the coefficients of 1, u, u ** 2, u ** 3 with
+    u = (x - knots[i]) / (knots[i + 1] - knots[i]) on segment i, in the
+    chosen precision. Uniform knots are kept as x0 and step only.
+    """
+    __slots__ = ('x0', 'x1', 'step', 'knots', 'C')
+
+    def __init__(self, model, dtype=np.float64):
+        """Reduce fitted model.
+
+        Keyword arguments:
+        model -- fitted Spline, Bezier, CubicBSpline or approximation
+        dtype -- coefficient type, np.float32 halves the memory
+        """
+        pp = model.piecewise()
+        breaks = pp.breaks
+        h = np.diff(breaks)
+        scale = h[:, np.newaxis] ** np.arange(4)
+        if pp.C.ndim == 3:
+            scale = scale[..., np.newaxis]
+        self.C = np.ascontiguousarray(pp.C * scale, dtype=dtype)
+        self.x0 = float(breaks[0])
+        self.x1 = float(breaks[-1])
+        self.step = float((breaks[-1] - breaks[0]) / (len(breaks) - 1))
+        uniform = self.x0 + self.step * np.arange(len(breaks))
+        if np.max(np.abs(breaks - uniform)) <= 4 * np.finfo(float).eps * np.max(np.abs(breaks)):
+            self.knots = None
+        else:
+            self.knots = np.array(breaks, dtype=float)
+
+    def value(self, x):
+        """Compute value in given point or array of points.
+
+        Points must be in interval [x[0], ..., x[n]] of the model, the
+        others give None for a number and nan in an array.
+        """
+        clock = instrument.start()
+        x = np.asarray(x, dtype=float)
+        n = len(self.C)
+        if self.knots is None:
+            u = (x - self.x0) / self.step
+            i = np.clip(np.floor(u).astype(np.intp), 0, n - 1)
+            u = u - i
+        else:
+            i = np.clip(np.searchsorted(self.knots, x) - 1, 0, n - 1)
+            u = (x - self.knots[i]) / (self.knots[i + 1] - self.knots[i])
+        clock = instrument.lap(self, 'value.lookup', clock, x.size)
+        # coefficients first: (4, ) + x.shape, with (k, ) at the end for k series
+        C = np.moveaxis(self.C[i], x.ndim, 0)
+        if self.C.ndim == 3:
+            u = u[..., np.newaxis]
+        # Horner's scheme in double precision
+        f = C[0] + u * (C[1] + u * (C[2] + u * C[3]))
+        instrument.lap(self, 'value.evaluate', clock, x.size)
+        return restrict(f, self.x0, self.x1, x)
+
+    def nbytes(self):
+        """Return memory used by the model in bytes, object and arrays."""
+        size = sys.getsizeof(self) + self.C.nbytes
+        if self.knots is not None:
+            size += self.knots.nbytes
+        return size
+
+    def state(self):
+        """Return attributes and arrays describing the model."""
+        arrays = {'C': self.C}
+        if self.knots is not None:
+            arrays['knots'] = self.knots
+        return {'x0': self.x0, 'x1': self.x1, 'step': self.step}, arrays
+
+    @classmethod
+    def from_state(cls, attrs, arrays):
+        """Create model from state(), arrays are used without copying."""
+        model = cls.__new__(cls)
+        model.x0 = attrs['x0']
+        model.x1 = attrs['x1']
+        model.step = attrs['step']
+        model.C = arrays['C']
+        model.knots = arrays.get('knots')
+        return model
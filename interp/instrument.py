@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+#-*- coding: UTF-8 -*-
+
+import threading
+import time
+
+# instrumentation is off by default, start() returns None and lap() does nothing
+enabled = False
+_callback = None
+_stats = {}
+_lock = threading.Lock()
+
+
+def enable(callback=None):
+    """Turn instrumentation on.
+
+    Keyword arguments:
+    callback -- called as callback(owner, phase, seconds, points) for every
+                recorded phase, optional
+    """
+    global enabled, _callback
+    _callback = callback
+    enabled = True
+
+
+def disable():
+    """Turn instrumentation off, collected stats are kept."""
+    global enabled, _callback
+    enabled = False
+    _callback = None
+
+
+def reset():
+    """Drop collected stats."""
+    with _lock:
+        _stats.clear()
+
+
+def stats():
+    """Return collected stats.
+
+    Returns dict owner -> phase -> {'calls', 'seconds', 'points'}, owner is
+    the qualified class name of the model, e.g. 'interp.spline.Spline'.
+    Phases are named '<method>.<step>', e.g. 'fit.solve' or 'value.lookup'.
+    """
+    with _lock:
+        return {
+            owner: {phase: dict(zip(('calls', 'seconds', 'points'), entry)) for phase, entry in phases.items()}
+            for owner, phases in _stats.items()
+        }
+
+
+def total(prefix='', owner=None):
+    """Return seconds spent in phases starting with prefix.
+
+    Keyword arguments:
+    prefix -- phase name prefix, e.g. 'fit' or 'value'
+    owner -- only phases of this owner, all by default
+    """
+    return sum(
+        s['seconds'] for name, phases in stats().items() if owner is None or name == owner
+        for phase, s in phases.items() if phase.startswith(prefix)
+    )
+
+
+def start():
+    """Return start time of a phase, None if instrumentation is off."""
+    return time.perf_counter() if enabled else None
+
+
+def lap(owner, phase, t, points=0):
+    """Record phase started at t, return start time of the next phase.
+
+    Keyword arguments:
+    owner -- model instance or name
+    phase -- phase name
+    t -- result of start() or of the previous lap()
+    points -- number of points processed in the phase
+    """
+    if t is None:
+        return None
+    now = time.perf_counter()
+    if not isinstance(owner, str):
+        owner = type(owner).__module__ + '.' + type(owner).__name__
+    with _lock:
+        entry = _stats.setdefault(owner, {}).setdefault(phase, [0, 0.0, 0])
+        entry[0] += 1
+        entry[1] += now - t
+        entry[2] += points
+    callback = _callback
+    if callback is not None:
+        callback(owner, phase, now - t, points)
+    return time.perf_counter()
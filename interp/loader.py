@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+#-*- coding: UTF-8 -*-
+
+import io
+import mmap
+import numpy as np
+
+# columns of station archive records (data/days.dat)
+STATION, YEAR, MONTH, DAY = 0, 1, 2, 3
+
+
+def iter_chunks(path, delimiter=None, usecols=None, chunk_size=1 << 22):
+    """Yield records of the file as (rows, columns) float arrays.
+
+    Keyword arguments:
+    path -- file with one record per line
+    delimiter -- field separator, whitespace by default
+    usecols -- columns to keep, all by default
+    chunk_size -- bytes per chunk, chunks are cut at line ends
+
+    The file is memory-mapped, so memory use is bounded by chunk_size.
+    """
+    if delimiter is not None and delimiter.isspace():
+        delimiter = None
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            return
+        with mm:
+            pos = 0
+            while pos < len(mm):
+                end = mm.find(b'\n', pos + chunk_size)
+                end = len(mm) if end < 0 else end + 1
+                chunk = io.BytesIO(mm[pos : end])
+                pos = end
+                yield np.loadtxt(chunk, delimiter=delimiter, usecols=usecols, ndmin=2)
+
+
+def load(path, delimiter=None, usecols=None, chunk_size=1 << 22):
+    """Load the file as (rows, columns) float array.
+
+    Keyword arguments:
+    path -- file with one record per line
+    delimiter -- field separator, whitespace by default
+    usecols -- columns to keep, all by default
+    chunk_size -- bytes per chunk
+    """
+    chunks = list(iter_chunks(path, delimiter, usecols, chunk_size))
+    if not chunks:
+        return np.zeros((0, 0))
+    return np.concatenate(chunks)
+
+
+def days(year, month, day):
+    """Convert dates to days since 1970-01-01."""
+    d = (np.asarray(year, dtype=np.int64) - 1970).astype('datetime64[Y]').astype('datetime64[M]')
+    d = d + (np.asarray(month, dtype=np.int64) - 1)
+    d = d.astype('datetime64[D]') + (np.asarray(day, dtype=np.int64) - 1)
+    return d.astype(np.int64)
+
+
+def load_stations(path, columns=5, chunk_size=1 << 22):
+    """Load station archive grouped by station id.
+
+    Keyword arguments:
+    path -- file in data/days.dat format: station id, year, month, day, fields
+    columns -- column of values, or several columns for several series
+    chunk_size -- bytes per chunk
+
+    Returns dict station id -> (knots, values), knots are days since
+    1970-01-01 in increasing order, values are (n, ) or (n, k) arrays.
+    Only the station, date and requested columns are kept while reading.
+    """
+    usecols = (STATION, YEAR, MONTH, DAY) + tuple(np.atleast_1d(columns))
+    station, knots, values = [], [], []
+    for chunk in iter_chunks(path, usecols=usecols, chunk_size=chunk_size):
+        station.append(chunk[:, 0].astype(np.int64))
+        knots.append(days(chunk[:, 1], chunk[:, 2], chunk[:, 3]))
+        values.append(chunk[:, 4] if np.ndim(columns) == 0 else chunk[:, 4:])
+    if not station:
+        return {}
+    station = np.concatenate(station)
+    knots = np.concatenate(knots)
+    values = np.concatenate(values)
+    order = np.lexsort((knots, station))
+    station, knots, values = station[order], knots[order].astype(float), values[order]
+    ids, first = np.unique(station, return_index=True)
+    bounds = np.append(first, len(station))
+    return {
+        int(ids[i]): (knots[bounds[i] : bounds[i + 1]], values[bounds[i] : bounds[i + 1]])
+        for i in range(len(ids))
+    }
@@ -0,0 +1,198 @@
+#!/usr/bin/python3
+#-*- coding: UTF-8 -*-
+
+import numpy as np
+
+# k! / (k - m)!, factor of the m-th derivative of x ** k
+_FALLING = np.array([
+    [1, 0, 0, 0],
+    [1, 1, 0, 0],
+    [1, 2, 2, 0],
+    [1, 3, 6, 6],
+], dtype=float)
+
+
+class PPoly:
+    """Piecewise cubic polynomial.
+
+    C[i] holds the coefficients of 1, (x - breaks[i]), (x - breaks[i]) ** 2,
+    (x - breaks[i]) ** 3 on [breaks[i], breaks[i + 1]], (4, ) or (4, k)
+    for k series. Points outside [breaks[0], breaks[-1]] use the first and
+    the last polynomial, or are wrapped into the period when periodic.
+    """
+    def __init__(self, breaks, C, periodic=False):
+        self.breaks = np.asarray(breaks, dtype=float)
+        self.C = np.asarray(C, dtype=float)
+        # points are wrapped modulo breaks[-1] - breaks[0]
+        self.periodic = periodic
+        self.__prefix = None
+
+    def locate(self, x):
+        """Return segment index i of x, breaks[i] <= x <= breaks[i + 1]."""
+        return np.clip(np.searchsorted(self.breaks, x) - 1, 0, len(self.breaks) - 2)
+
+    def value(self, x, order=0):
+        """Compute value or derivative of given order in points x."""
+        x = np.asarray(x, dtype=float)
+        if self.periodic:
+            x = wrap(x, self.breaks[0], self.breaks[-1])[1]
+        i = self.locate(x)
+        t = x - self.breaks[i]
+        if self.C.ndim == 3:
+            t = t[..., np.newaxis]
+        f = np.zeros(x.shape + self.C.shape[2:])
+        # Horner's scheme over the differentiated coefficients
+        for k in reversed(range(order, 4)):
+            f = f * t + _FALLING[k, order] * self.C[i, k]
+        return f
+
+    def antiderivative(self, x):
+        """Compute integral from breaks[0] to x."""
+        x = np.asarray(x, dtype=float)
+        cycles = 0.0
+        if self.periodic:
+            cycles, x = wrap(x, self.breaks[0], self.breaks[-1])
+        i = self.locate(x)
+        t = x - self.breaks[i]
+        if self.C.ndim == 3:
+            t = t[..., np.newaxis]
+            cycles = np.asarray(cycles)[..., np.newaxis]
+        C = self.C
+        prefix = self.prefix()
+        return cycles * prefix[-1] + prefix[i] + t * (C[i, 0] + t * (C[i, 1] / 2 + t * (C[i, 2] / 3 + t * C[i, 3] / 4)))
+
+    def integrate(self, a, b):
+        """Compute integrals from a to b, a and b are broadcast together."""
+        return self.antiderivative(b) - self.antiderivative(a)
+
+    def roots(self, level=0.0):
+        """Return sorted points x where the polynomial equals level.
+
+        Gives a list of arrays, one per series, for k series. Segments
+        whose Bernstein bounds exclude the level are skipped, the others
+        are solved in closed form all at once. Segments equal to level
+        give their first break.
+        """
+        if self.C.ndim == 3:
+            return [PPoly(self.breaks, self.C[:, :, j]).roots(level) for j in range(self.C.shape[2])]
+        h = np.diff(self.breaks)
+        # coefficients in u = (x - breaks[i]) / h, u in [0, 1]
+        a = self.C * h[:, np.newaxis] ** np.arange(4)
+        a[:, 0] -= level
+        # Bernstein coefficients bound the polynomial on the segment
+        b = a.dot(np.array([
+            [1, 1, 1, 1],
+            [0, 1 / 3, 2 / 3, 1],
+            [0, 0, 1 / 3, 1],
+            [0, 0, 0, 1],
+        ]))
+        i = np.flatnonzero((b.min(axis=1) <= 0) & (b.max(axis=1) >= 0))
+        u = _cubic_roots(a[i])
+        # polish with Newton's method on the original coefficients
+        c = a[i][:, np.newaxis, :]
+        for _ in range(2):
+            f = c[..., 0] + u * (c[..., 1] + u * (c[..., 2] + u * c[..., 3]))
+            df = c[..., 1] + u * (2 * c[..., 2] + u * 3 * c[..., 3])
+            u = np.where(df != 0, u - f / np.where(df != 0, df, 1), u)
+        tol = 1e-9
+        keep = (u >= -tol) & (u <= 1 + tol)
+        x = self.breaks[i, np.newaxis] + np.clip(u, 0, 1) * h[i, np.newaxis]
+        x = np.sort(x[keep])
+        # roots at a break are found in both segments
+        if len(x) > 1:
+            scale = np.finfo(float).eps * 64 * max(np.max(np.abs(self.breaks)), np.max(h))
+            x = x[np.concatenate(([True], np.diff(x) > scale))]
+        return x
+
+    def prefix(self):
+        """Return integrals from breaks[0] to every break, computed once."""
+        if self.__prefix is None:
+            h = np.diff(self.breaks)
+            if self.C.ndim == 3:
+                h = h[:, np.newaxis]
+            whole = h * (self.C[:, 0] + h * (self.C[:, 1] / 2 + h * (self.C[:, 2] / 3 + h * self.C[:, 3] / 4)))
+            self.__prefix = np.concatenate((np.zeros((1, ) + whole.shape[1:]), np.cumsum(whole, axis=0)))
+        return self.__prefix
+
+
+def _cubic_roots(a):
+    """Return real roots of a[:, 0] + a[:, 1] u + a[:, 2] u ** 2 + a[:, 3] u ** 3.
+
+    Returns (len(a), 3) array, missing roots are nan. Polynomials equal to
+    zero give root 0.
+    """
+    a0, a1, a2, a3 = a.T
+    u = np.full((len(a), 3), np.nan)
+    scale = np.abs(a).sum(axis=1)
+    zero = scale == 0
+    u[zero, 0] = 0.0
+    cubic = np.abs(a3) > 1e-12 * scale
+    quadratic = ~cubic & (np.abs(a2) > 1e-12 * scale)
+    linear = ~cubic & ~quadratic & ~zero
+    # linear
+    u[linear, 0] = -a0[linear] / a1[linear]
+    # quadratic, without cancellation
+    A, B, C = a2[quadratic], a1[quadratic], a0[quadratic]
+    d = B * B - 4 * A * C
+    real = d >= 0
+    q = -0.5 * (B + np.copysign(np.sqrt(np.where(real, d, 0)), B))
+    r = np.full((len(A), 2), np.nan)
+    r[real, 0] = (q / A)[real]
+    r[real & (q != 0), 1] = (C / np.where(q != 0, q, 1))[real & (q != 0)]
+    u[quadratic, : 2] = r
+    # cubic: depressed form t ** 3 + p t + q with u = t - b / 3
+    b, c, d = a2[cubic] / a3[cubic], a1[cubic] / a3[cubic], a0[cubic] / a3[cubic]
+    p = c - b * b / 3
+    q = 2 * b ** 3 / 27 - b * c / 3 + d
+    disc = (q / 2) ** 2 + (p / 3) ** 3
+    r = np.full((len(b), 3), np.nan)
+    one = disc > 0
+    s = np.sqrt(np.where(one, disc, 0))
+    r[one, 0] = (np.cbrt(-q / 2 + s) + np.cbrt(-q / 2 - s))[one]
+    # three real roots, trigonometric form; p = 0 here only with q = 0
+    three = ~one
+    m = 2 * np.sqrt(np.maximum(-p / 3, 0))
+    cos = np.where(p < 0, 3 * q / np.where(p < 0, p, -1) * np.sqrt(3 / np.maximum(-p, 1e-300)) / 2, 0)
+    phi = np.arccos(np.clip(cos, -1, 1)) / 3
+    for k in range(3):
+        r[three, k] = (m * np.cos(phi - 2 * np.pi * k / 3))[three]
+    u[cubic] = r - b[:, np.newaxis] / 3
+    return u
+
+
+def check_periodic(values):
+    """Raise ValueError unless the last values repeat the first ones.
+
+    They may differ by rounding, relative to the largest value of the series.
+    """
+    values = np.asarray(values, dtype=float)
+    if len(values) < 4:
+        raise ValueError("periodic fit needs at least 4 knots")
+    if np.any(np.abs(values[-1] - values[0]) > 1e-10 * np.max(np.abs(values), axis=0)):
+        raise ValueError("values[n] must equal values[0] for periodic fit")
+
+
+def wrap(x, lo, hi):
+    """Map points into [lo, hi) modulo the period hi - lo.
+
+    Returns the numbers of whole periods and the mapped points.
+    """
+    x = np.asarray(x, dtype=float)
+    cycles = np.floor((x - lo) / (hi - lo))
+    return cycles, np.clip(x - cycles * (hi - lo), lo, hi)
+
+
+def restrict(f, lo, hi, *x):
+    """Blank f where any of x is outside [lo, hi].
+
+    Gives None for numbers x and nan for arrays x, as value() does.
+    """
+    x = np.broadcast_arrays(*[np.asarray(e, dtype=float) for e in x])
+    outside = np.zeros(x[0].shape, dtype=bool)
+    for e in x:
+        outside |= (e < lo) | (e > hi)
+    if outside.ndim == 0:
+        return None if outside else (f if np.ndim(f) else float(f))
+    f = np.array(f, dtype=float)
+    f[outside] = np.nan
+    return f
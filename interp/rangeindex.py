@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+#-*- coding: UTF-8 -*-
+
+import numpy as np
+
+from .ppoly import restrict
+
+
+class RangeIndex:
+    """Minimum, maximum and mean of a fitted model over windows.
+
+    Exact extrema of every segment, from the roots of its derivative, are
+    kept in segment trees; a window costs two partial segments and
+    O(log n) tree nodes. Means come from the integrals of the model.
+    """
+    def __init__(self, model):
+        """Build index of fitted model.
+
+        Keyword arguments:
+        model -- fitted Spline, Bezier, CubicBSpline or approximation of
+                 one series
+        """
+        self.pp = model.piecewise()
+        if self.pp.C.ndim != 2:
+            raise ValueError("index covers one series, fit them separately")
+        self.h = np.diff(self.pp.breaks)
+        m = len(self.h)
+        low, high = self.__extrema(np.arange(m), np.zeros(m), self.h)
+        self.size = 1
+        while self.size < m:
+            self.size *= 2
+        # node i has children 2 i and 2 i + 1, leaves start at size
+        self.__min = np.full(2 * self.size, np.inf)
+        self.__max = np.full(2 * self.size, -np.inf)
+        self.__min[self.size : self.size + m] = low
+        self.__max[self.size : self.size + m] = high
+        level = self.size
+        while level > 1:
+            self.__min[level // 2 : level] = np.minimum(self.__min[level : 2 * level : 2], self.__min[level + 1 : 2 * level : 2])
+            self.__max[level // 2 : level] = np.maximum(self.__max[level : 2 * level : 2], self.__max[level + 1 : 2 * level : 2])
+            level //= 2
+
+    def range_min(self, a, b):
+        """Return minimum over [a, b], numbers or arrays broadcast together.
+
+        Windows must be in interval [x[0], ..., x[n]], others give None
+        for numbers and nan in arrays.
+        """
+        return self.__query(a, b, np.minimum, self.__min, 0)
+
+    def range_max(self, a, b):
+        """Return maximum over [a, b], numbers or arrays broadcast together."""
+        return self.__query(a, b, np.maximum, self.__max, 1)
+
+    def range_mean(self, a, b):
+        """Return mean over [a, b], numbers or arrays broadcast together.
+
+        A window of zero width gives the value in its point.
+        """
+        a, b = np.broadcast_arrays(np.asarray(a, dtype=float), np.asarray(b, dtype=float))
+        lo, hi = np.minimum(a, b), np.maximum(a, b)
+        width = hi - lo
+        with np.errstate(invalid='ignore', divide='ignore'):
+            f = np.where(width > 0, self.pp.integrate(lo, hi) / np.where(width > 0, width, 1), self.pp.value(lo))
+        return restrict(f, self.pp.breaks[0], self.pp.breaks[-1], a, b)
+
+    def __query(self, a, b, pick, tree, which):
+        a, b = np.broadcast_arrays(np.asarray(a, dtype=float), np.asarray(b, dtype=float))
+        lo, hi = np.minimum(a, b).ravel(), np.maximum(a, b).ravel()
+        start = self.pp.breaks[:-1]
+        i = self.pp.locate(lo)
+        j = self.pp.locate(hi)
+        same = i == j
+        # partial first and last segments
+        f = pick(
+            self.__extrema(i, lo - start[i], np.where(same, hi - start[i], self.h[i]))[which],
+            self.__extrema(j, np.where(same, lo - start[j], 0.0), hi - start[j])[which],
+        )
+        # whole segments i + 1, ..., j - 1 from the tree, bottom up
+        l = i + 1 + self.size
+        r = j + self.size
+        while True:
+            active = l < r
+            if not active.any():
+                break
+            odd = active & (l % 2 == 1)
+            f[odd] = pick(f[odd], tree[l[odd]])
+            l = l + odd
+            odd = active & (r % 2 == 1)
+            r = r - odd
+            f[odd] = pick(f[odd], tree[r[odd]])
+            l //= 2
+            r //= 2
+        return restrict(f.reshape(a.shape), self.pp.breaks[0], self.pp.breaks[-1], a, b)
+
+    def __extrema(self, i, t0, t1):
+        # min and max of the polynomials of segments i over [t0, t1]
+        C = self.pp.C[i]
+        t = [t0, t1]
+        # stationary points: 3 C3 t ** 2 + 2 C2 t + C1 = 0
+        A, B, D = 3 * C[:, 3], 2 * C[:, 2], C[:, 1]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            disc = B * B - 4 * A * D
+            q = -0.5 * (B + np.copysign(np.sqrt(disc), B))
+            t.append(np.where(A != 0, q / A, -D / B))
+            t.append(D / q)
+        f = []
+        for e in t:
+            e = np.where((e >= t0) & (e <= t1), e, t0)
+            f.append(C[:, 0] + e * (C[:, 1] + e * (C[:, 2] + e * C[:, 3])))
+        return np.min(f, axis=0), np.max(f, axis=0)
@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+#-*- coding: UTF-8 -*-
+
+import collections
+import concurrent.futures
+import os
+
+import numpy as np
+
+
+def evaluate(model, x, out, chunk_size=1 << 20, threads=None):
+    """Evaluate fitted model in many points chunk by chunk.
+
+    Keyword arguments:
+    model -- fitted model whose value() takes arrays
+    x -- (start, stop, num) uniform grid as in np.linspace, or array of
+         points, e.g. np.memmap or np.load(..., mmap_mode='r')
+    out -- output .npy file name, or writable array of shape
+           (num, ) or (num, k) for a model fitted to k series
+    chunk_size -- points per chunk
+    threads -- number of threads, os.cpu_count() by default
+
+    Chunks are evaluated on a thread pool, numpy releases the GIL in the
+    array operations. At most two chunks per thread are in flight, so
+    memory use is bounded by chunk_size whatever the number of points.
+    Returns the output array, a np.memmap for a file name.
+    """
+    if isinstance(x, tuple):
+        start, stop, num = x
+
+        def points(i, j):
+            # as np.linspace, the last point is exactly stop
+            if num == 1:
+                return np.full((j - i, ), float(start))
+            p = start + (stop - start) * (np.arange(i, j) / (num - 1))
+            if j == num:
+                p[-1] = stop
+            return p
+    else:
+        num = len(x)
+        points = lambda i, j: np.asarray(x[i : j], dtype=float)
+    if isinstance(out, str):
+        # shape of one value, () or (k, )
+        shape = np.shape(model.value(points(0, 1)))[1:] if num else ()
+        out = np.lib.format.open_memmap(out, mode='w+', dtype=float, shape=(num, ) + shape)
+    elif len(out) != num:
+        raise ValueError("out has %d rows for %d points" % (len(out), num))
+
+    def work(i, j):
+        out[i : j] = model.value(points(i, j))
+
+    threads = threads or os.cpu_count() or 1
+    with concurrent.futures.ThreadPoolExecutor(threads) as pool:
+        pending = collections.deque()
+        for i in range(0, num, chunk_size):
+            if len(pending) >= 2 * threads:
+                pending.popleft().result()
+            pending.append(pool.submit(work, i, min(i + chunk_size, num)))
+        for future in pending:
+            future.result()
+    if isinstance(out, np.memmap):
+        out.flush()
+    return out
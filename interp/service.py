@@ -0,0 +1,166 @@
+#!/usr/bin/python3
+#-*- coding: UTF-8 -*-
+
+"""Serve fitted models over TCP, one JSON request per line.
+
+    python -m interp.service --port 8765 temperature=temperature.model
+    python -m interp.service --port 8765 stations.models
+
+A file without a name is a storage.save_all() archive, its models are
+served under their names. Request
+{"id": 1, "model": "temperature", "x": 12.5} is answered with
+{"id": 1, "value": 3.25}, x may also be a list. Values outside the
+interval of the model are null, failures give {"id": 1, "error": "..."}.
+Responses on a connection come in the order the values are ready.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+
+import numpy as np
+
+from . import storage
+
+
+def _plain(f):
+    # JSON value of numbers or arrays, nan becomes null
+    if np.ndim(f) == 0:
+        return None if f is None or np.isnan(f) else float(f)
+    return [_plain(e) for e in f]
+
+
+class Service:
+    """Fitted models answering concurrent queries in batches.
+
+    Queries of a model arriving within window seconds of the first one
+    are evaluated by one value() call on an array.
+    """
+    def __init__(self, models, window=0.001, max_batch=4096):
+        """Create service.
+
+        Keyword arguments:
+        models -- dict name -> fitted model whose value() takes arrays
+        window -- seconds a query waits for others to join its batch
+        max_batch -- a batch with this many points is evaluated at once
+        """
+        self.models = dict(models)
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.queries = 0
+        # model name -> ([x], [future], timer) of the batch being gathered
+        self.__pending = {}
+
+    async def value(self, name, x):
+        """Compute value of model name in point x, batched with concurrent queries."""
+        model = self.models[name]
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if name not in self.__pending:
+            self.__pending[name] = ([], [], loop.call_later(self.window, self.__flush, name, model))
+        points, futures, _ = self.__pending[name]
+        points.append(x)
+        futures.append(future)
+        if len(points) >= self.max_batch:
+            self.__flush(name, model)
+        return await future
+
+    def __flush(self, name, model):
+        points, futures, timer = self.__pending.pop(name)
+        # a batch flushed early doesn't wait for its timer
+        timer.cancel()
+        self.batches += 1
+        self.queries += len(points)
+        try:
+            f = model.value(np.array(points, dtype=float))
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, value in zip(futures, f):
+            if not future.done():
+                future.set_result(value)
+
+    async def respond(self, line):
+        """Answer one request line, return response line."""
+        request = {}
+        try:
+            request = json.loads(line.decode())
+            if request.get('model') not in self.models:
+                raise ValueError("unknown model %s" % request.get('model'))
+            x = request['x']
+            if isinstance(x, list):
+                model = self.models[request['model']]
+                value = model.value(np.array(x, dtype=float))
+            else:
+                value = await self.value(request['model'], float(x))
+            response = {'id': request.get('id'), 'value': _plain(value)}
+        except Exception as e:
+            response = {'id': request.get('id') if isinstance(request, dict) else None, 'error': str(e)}
+        return (json.dumps(response) + '\n').encode()
+
+    async def handle(self, reader, writer):
+        """Serve one connection."""
+        tasks = set()
+
+        async def answer(line):
+            writer.write(await self.respond(line))
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    task = asyncio.ensure_future(answer(line))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                await writer.drain()
+            if tasks:
+                await asyncio.wait(tasks)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=0):
+        """Start listening, return asyncio server."""
+        return await asyncio.start_server(self.handle, host, port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m interp.service', description='Serve fitted models.')
+    parser.add_argument('models', nargs='+', metavar='NAME=FILE', help='model saved with interp.storage, or FILE saved with save_all')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--window', type=float, default=0.001, help='seconds to gather a batch')
+    args = parser.parse_args(argv)
+
+    models = {}
+    for spec in args.models:
+        if '=' not in spec:
+            models.update(storage.load_all(spec))
+            continue
+        name, path = spec.split('=', 1)
+        models[name] = storage.load(path)
+    service = Service(models, args.window)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server = loop.run_until_complete(service.start(args.host, args.port))
+    print('serving %s on %s' % (', '.join(sorted(models)), ', '.join(str(s.getsockname()) for s in server.sockets)))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    server.close()
+    loop.run_until_complete(server.wait_closed())
+    loop.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
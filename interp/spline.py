@@ -4,94 +4,310 @@
 import numpy as np
 from numpy import pi
 
+from . import instrument
+from .ppoly import PPoly, check_periodic, restrict, wrap
+from .tdma import factorize
+
 class Spline:
     def __init__(self):
-        pass
+        self.periodic = False
 
-    def fit(self, knots, values, d0, dn):
+    def fit(self, knots, values, d0=None, dn=None, periodic=False):
         """Fit spline to given values known in knots.
 
         Keyword arguments:
         knots -- knots
-        values -- given values
-        d0 -- derivative in knots[0]
-        dn -- derivative in knots[n]
+        values -- given values, (n, ) or (n, k) for k series on the same knots
+        d0 -- derivative in knots[0], number or k numbers
+        dn -- derivative in knots[n], number or k numbers
+        periodic -- instead of d0 and dn, continue the spline with period
+                    knots[n] - knots[0]; values[n] must equal values[0]
         """
-        self.knots = np.array(knots)
-        self.n = len(knots)
-        self.values = np.array(values)
-        h = knots[1] - knots[0]
-        # form the known-values vector Y
-        Y = np.zeros((self.n))
-        Y[0] = d0
-        Y[1 : self.n - 1] = [3.0 / h * (self.values[i + 2] - self.values[i]) for i in range(self.n - 2)]
-        Y[self.n - 1] = dn
-        # compute the derivatives vector D with Tridiagonal Matrix Algorithm
-        D = self.__solve(Y)
-        # compute the coefficients in matrix form
-        s = np.array([
-            [1.0, 0, 0, 0],
-            [0, 1.0, 0, 0],
-            [-3.0 / (h ** 2), -2.0 / h, 3.0 / (h ** 2), -1.0 / h],
-            [2.0 / (h ** 3), 1.0 / (h ** 2), -2.0 / (h ** 3), 1.0 / (h ** 2)]
-        ])
-        p = np.transpose([[self.values[i], D[i], self.values[i + 1], D[i + 1]] for i in range(self.n - 1)])
-        self.A = np.transpose(s.dot(p))
+        clock = instrument.start()
+        knots = np.array(knots, dtype=float)
+        values = np.array(values, dtype=float)
+        n = len(knots)
+        self.h = knots[1] - knots[0]
+        self.periodic = periodic
+        if periodic:
+            check_periodic(values)
+            # D[n] = D[0], the first n - 1 derivatives form a cyclic system
+            v = values[: n - 1]
+            Y = 3.0 / self.h * (np.roll(v, -1, axis=0) - np.roll(v, 1, axis=0))
+            clock = instrument.lap(self, 'fit.rhs', clock, n)
+            ones = np.ones((n - 1, ))
+            D = factorize(ones, 4 * ones, ones, cyclic=True, key=('uniform', n - 1)).solve(Y)
+            D = np.concatenate((D, D[:1]))
+            alpha = beta = None
+            self.dn = np.asarray(D[-1]).tolist()
+        elif d0 is None or dn is None:
+            raise ValueError("d0 and dn are required unless periodic")
+        else:
+            self.dn = dn
+            # form the known-values vector Y
+            Y = np.zeros(values.shape)
+            Y[0] = d0
+            Y[1 : n - 1] = 3.0 / self.h * (values[2:] - values[:-2])
+            Y[n - 1] = dn
+            clock = instrument.lap(self, 'fit.rhs', clock, n)
+            # compute the derivatives vector D with Tridiagonal Matrix Algorithm,
+            # the forward sweep state is kept for append
+            tdma = self.__tdma(n)
+            beta = tdma.sweep(Y)
+            D = tdma.solve(Y, beta)
+            alpha = np.array(tdma.alpha)
+        clock = instrument.lap(self, 'fit.solve', clock, n)
+        self.__knots = knots
+        self.__values = values
+        self.__D = D
+        self.__alpha = alpha
+        self.__beta = beta
+        # A[i] holds the segment coefficients, (4, ) or (4, k)
+        self.__A = self.__coefficients(values[:-1], D[:-1], values[1:], D[1:])
+        self.__lo = 0
+        self.__hi = n
+        self.__update()
+        instrument.lap(self, 'fit.coefficients', clock, n)
+        return self
+
+    def append(self, knot, value, dn=None, window=None):
+        """Append new knot to the end of fitted spline.
+
+        Keyword arguments:
+        knot -- new knot, must continue the grid: knots[n] + h
+        value -- value in knot, number or k numbers
+        dn -- derivative in the new last knot, the last given one by default
+        window -- keep at most window last knots, dropping the oldest ones
+
+        Only the trailing derivatives that change in double precision and
+        their segments are recomputed, so the cost does not depend on the
+        number of knots already fitted. Dropped knots leave the derivative
+        in the new first knot fixed.
+        """
+        if self.periodic:
+            raise ValueError("can't append to periodic spline")
+        clock = instrument.start()
+        if self.__beta is None:
+            self.__restore()
+        lo, hi = self.__lo, self.__hi
+        if abs(knot - self.__knots[hi - 1] - self.h) > 1e-6 * abs(self.h):
+            raise ValueError("knot must continue the grid with step %g" % self.h)
+        if dn is not None:
+            self.dn = dn
+        if hi == len(self.__knots):
+            self.__reserve()
+            lo, hi = self.__lo, self.__hi
+        K, V, D = self.__knots, self.__values, self.__D
+        alpha, beta = self.__alpha, self.__beta
+        K[hi] = knot
+        V[hi] = value
+        # the former last equation becomes an interior one: a = 1, b = 4, c = 1
+        m = alpha[hi - 1] + 4
+        alpha[hi] = -1 / m
+        beta[hi] = (3.0 / self.h * (V[hi] - V[hi - 2]) - beta[hi - 1]) / m
+        D[hi] = self.dn
+        # back substitution while derivatives still change
+        eps = np.finfo(float).eps
+        i = hi - 1
+        while i >= lo:
+            new = alpha[i + 1] * D[i + 1] + beta[i + 1]
+            done = i < hi - 1 and (abs(new - D[i]) <= eps * abs(new)).all()
+            D[i] = new
+            if done:
+                break
+            i -= 1
+        i = max(i - 1, lo)
+        self.__A[i : hi] = self.__coefficients(V[i : hi], D[i : hi], V[i + 1 : hi + 1], D[i + 1 : hi + 1])
+        self.__hi = hi = hi + 1
+        if window is not None and hi - lo > window:
+            self.__lo = lo = hi - window
+            # the first knot keeps its derivative: restart the forward sweep,
+            # older sweep state differs below double precision after a few rows
+            alpha[lo + 1] = 0.0
+            beta[lo + 1] = D[lo]
+            for i in range(lo + 1, min(lo + 32, hi - 1)):
+                m = alpha[i] + 4
+                alpha[i + 1] = -1 / m
+                beta[i + 1] = (3.0 / self.h * (V[i + 1] - V[i - 1]) - beta[i]) / m
+        self.__update()
+        instrument.lap(self, 'append', clock, 1)
         return self
 
     def value(self, knot):
         """Compute value in given knot.
 
         Keyword arguments:
-        knot -- given knot, must be in interval [x[0], ..., x[n]]
+        knot -- given knot, must be in interval [x[0], ..., x[n]];
+                may also be an array of knots of any shape
+
+        For an array the result is an ndarray of the same shape with nan
+        in place of the knots outside the interval. A spline fitted to k
+        series gives k values per knot, stacked along the last axis. A
+        periodic spline takes any knot, wrapped into the period.
         """
         if self.A is None:
             return None
-        if (knot < self.knots[0]) or (knot > self.knots[self.n - 1]):
-            return None
+        clock = instrument.start()
+        x = np.asarray(knot, dtype=float)
+        if self.periodic:
+            x = wrap(x, self.knots[0], self.knots[-1])[1]
+        # locate segments in bulk: knots[i] <= x <= knots[i + 1]
+        i = np.clip(np.searchsorted(self.knots, x) - 1, 0, self.n - 2)
+        clock = instrument.lap(self, 'value.lookup', clock, x.size)
+        t = x - self.knots[i]
+        if self.A.ndim == 3:
+            t = t[..., np.newaxis]
+        # Horner's scheme over the coefficient rows
+        f = ((self.A[i, 3] * t + self.A[i, 2]) * t + self.A[i, 1]) * t + self.A[i, 0]
+        outside = (x < self.knots[0]) | (x > self.knots[self.n - 1])
+        instrument.lap(self, 'value.evaluate', clock, x.size)
+        if x.ndim == 0:
+            return None if outside else (f if f.ndim else float(f))
+        f[outside] = np.nan
+        return f
+
+    def derivative(self, x, order=1):
+        """Compute derivative of given order in given knot.
+
+        Keyword arguments:
+        x -- given knot or array of knots, must be in interval [x[0], ..., x[n]]
+             unless the spline is periodic
+        order -- derivative order
+        """
+        if self.periodic:
+            f = self.piecewise().value(x, order)
+            return f if f.ndim else float(f)
+        return restrict(self.piecewise().value(x, order), self.knots[0], self.knots[-1], x)
 
-        i = [j for j in range(len(self.knots)-1) if (knot >= self.knots[j] and knot <= self.knots[j + 1])][0]
-        x_i = np.array([
-            1,
-            (knot - self.knots[i]),
-            (knot - self.knots[i]) ** 2,
-            (knot - self.knots[i]) ** 3,
+    def integrate(self, a, b):
+        """Compute definite integral from a to b.
+
+        Keyword arguments:
+        a -- lower limit, number or array
+        b -- upper limit, number or array, broadcast with a
+
+        Limits must be in interval [x[0], ..., x[n]] unless the spline is
+        periodic. Integrals over whole segments are summed once, so every
+        query costs a segment search.
+        """
+        if self.periodic:
+            f = self.piecewise().integrate(a, b)
+            return f if f.ndim else float(f)
+        return restrict(self.piecewise().integrate(a, b), self.knots[0], self.knots[-1], a, b)
+
+    def roots(self, level=0.0):
+        """Return all knots x in [x[0], x[n]] where the spline equals level.
+
+        Keyword arguments:
+        level -- value to cross, e.g. a threshold
+
+        Returns sorted array, or list of arrays for k series. Each segment
+        cubic is solved in closed form, segments whose coefficient bounds
+        exclude the level are skipped.
+        """
+        return self.piecewise().roots(level)
+
+    def piecewise(self):
+        """Return the spline as PPoly, A is already in its form."""
+        if self.__pp is None:
+            self.__pp = PPoly(self.knots, self.A, self.periodic)
+        return self.__pp
+
+    def state(self):
+        """Return attributes and arrays describing the fitted spline."""
+        attrs = {'h': float(self.h), 'dn': np.asarray(self.dn).tolist(), 'periodic': self.periodic}
+        return attrs, {'knots': self.knots, 'A': self.A}
+
+    @classmethod
+    def from_state(cls, attrs, arrays):
+        """Create fitted spline from state(), arrays are used without copying."""
+        spline = cls()
+        spline.h = attrs['h']
+        spline.dn = attrs['dn']
+        spline.periodic = attrs.get('periodic', False)
+        spline.__knots = arrays['knots']
+        spline.__A = arrays['A']
+        # values, derivatives and sweep state are restored by append
+        spline.__values = spline.__D = spline.__alpha = spline.__beta = None
+        spline.__lo, spline.__hi = 0, len(spline.__knots)
+        spline.__update()
+        return spline
+
+    def __restore(self):
+        # values, derivatives and forward sweep state from the coefficients
+        lo, hi = self.__lo, self.__hi
+        knots, A = self.__knots[lo : hi], self.__A[lo : hi - 1]
+        pp = PPoly(knots, A)
+        values = np.concatenate((A[:, 0], pp.value(knots[-1:])))
+        D = np.concatenate((A[:, 1], pp.value(knots[-1:], 1)))
+        Y = np.zeros(values.shape)
+        Y[0] = D[0]
+        Y[1 : -1] = 3.0 / self.h * (values[2:] - values[:-2])
+        Y[-1] = D[-1]
+        tdma = self.__tdma(len(knots))
+        self.__knots = np.array(knots)
+        self.__A = np.array(A)
+        self.__values = values
+        self.__D = D
+        self.__alpha = np.array(tdma.alpha)
+        self.__beta = tdma.sweep(Y)
+        self.__lo, self.__hi = 0, len(knots)
+
+    def __coefficients(self, v0, d0, v1, d1):
+        # compute the coefficients in matrix form
+        h = self.h
+        s = np.array([
+            [1.0, 0, 0, 0],
+            [0, 1.0, 0, 0],
+            [-3.0 / (h ** 2), -2.0 / h, 3.0 / (h ** 2), -1.0 / h],
+            [2.0 / (h ** 3), 1.0 / (h ** 2), -2.0 / (h ** 3), 1.0 / (h ** 2)]
         ])
-        return x_i.dot(self.A[i])
+        p = np.stack((v0, d0, v1, d1), axis=1)
+        return np.einsum('rq,iq...->ir...', s, p)
 
-    def __solve(self, d):
-        n = len(d)          # eq number
-        x = np.zeros((n, )) # result
-        alpha = np.zeros((n, ))
-        beta = np.zeros((n, ))
-        alpha[1] = 0
-        beta[1] = d[0]
-        # implicit: a = 1, b = 4, c = 1
-        for i in range(2, n):
-            alpha[i] = -1 / (alpha[i - 1] + 4)
-            beta[i] = (d[i - 1] - beta[i - 1]) / (alpha[i - 1] + 4)
-        # explicit eval of last component
-        x[-1] = d[-1]
-        for i in reversed(range(0, n - 1)):
-            x[i] = alpha[i + 1] * x[i + 1] + beta[i + 1]
+    def __reserve(self):
+        # move knots in use to the front of buffers twice as large
+        lo, hi = self.__lo, self.__hi
+        size = 2 * (hi - lo)
+        for name in ('knots', 'values', 'D', 'alpha', 'beta', 'A'):
+            attr = '_Spline__' + name
+            old = getattr(self, attr)[lo : hi]
+            new = np.zeros((size, ) + old.shape[1:])
+            new[: len(old)] = old
+            setattr(self, attr, new)
+        self.__lo, self.__hi = 0, hi - lo
 
-        return x
+    def __update(self):
+        # public views of knots in use
+        lo, hi = self.__lo, self.__hi
+        self.n = hi - lo
+        self.knots = self.__knots[lo : hi]
+        self.values = None if self.__values is None else self.__values[lo : hi]
+        self.A = self.__A[lo : hi - 1]
+        self.__pp = None
 
+    def __tdma(self, n):
+        # implicit: a = 1, b = 4, c = 1, known first and last derivatives
+        a = np.ones((n, ))
+        b = np.full((n, ), 4.0)
+        c = np.ones((n, ))
+        a[0] = c[0] = a[-1] = c[-1] = 0.0
+        b[0] = b[-1] = 1.0
+        return factorize(a, b, c, key=('spline', n))
 
 
 if __name__ == "__main__":
     import matplotlib.pyplot as plt
-    from TDMAsolver import TDMAsolver
 
     knots = np.arange(0.0, 8 * pi + 0.1, pi / 4)
     values = knots * np.sin(knots) + np.log(knots + 1)
     d = np.divide(1, (knots + 1)) + np.sin(knots) + knots * np.cos(knots)
     x = np.arange(0.0, 8 * pi, 0.05)
     spl = Spline().fit(knots, values, d[0], d[-1])
-    f = [spl.value(e) for e in x]
+    f = spl.value(x)
 
     true_values = x * np.sin(x) + np.log(x + 1)
-    SSE = np.sum([(f[i] - true_values[i]) ** 2 for i in range(len(x))])
+    SSE = np.sum((f - true_values) ** 2)
 
     line1, = plt.plot(knots, values, 'ro', label="Заданные значения")
     line2, = plt.plot(x, f, label="Интерполяция")
@@ -0,0 +1,144 @@
+#!/usr/bin/python3
+#-*- coding: UTF-8 -*-
+
+import importlib
+import json
+import mmap
+import struct
+import sys
+
+import numpy as np
+
+MAGIC = b'INTERPM1'
+# array data offsets are multiples of ALIGN bytes
+ALIGN = 64
+# model classes which can be loaded
+MODELS = (
+    'interp.spline.Spline',
+    'interp.bezier.Bezier',
+    'interp.bspline.CubicBSpline',
+    'approx.approx.CubicBSpline',
+    'interp.compact.CompactModel',
+)
+
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _state(model):
+    kind = type(model).__module__ + '.' + type(model).__name__
+    if kind not in MODELS:
+        raise TypeError("can't save %s" % kind)
+    attrs, arrays = model.state()
+    return kind, attrs, {name: np.ascontiguousarray(a) for name, a in arrays.items()}
+
+
+def _write(path, states, header):
+    # header(entries) wraps the descriptions of the models in states
+    # the header size depends on the offsets, grow it until they fit
+    size = 0
+    while True:
+        offset = _aligned(len(MAGIC) + 8 + size)
+        entries = []
+        for kind, attrs, arrays in states:
+            layout = {}
+            for name, a in arrays.items():
+                layout[name] = {'dtype': a.dtype.newbyteorder('<').str, 'shape': a.shape, 'offset': offset}
+                offset = _aligned(offset + a.nbytes)
+            entries.append({'type': kind, 'attrs': attrs, 'arrays': layout})
+        data = json.dumps(header(entries)).encode()
+        if len(data) <= size:
+            break
+        size = len(data) + 64
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', size))
+        f.write(data.ljust(size))
+        for (kind, attrs, arrays), entry in zip(states, entries):
+            for name, a in arrays.items():
+                spec = entry['arrays'][name]
+                f.seek(spec['offset'])
+                f.write(a.astype(spec['dtype'], copy=False).tobytes())
+        f.truncate(offset)
+
+
+def _open(path, memmap):
+    with open(path, 'rb') as f:
+        if memmap:
+            # the mapping keeps a duplicate of the descriptor unless told not to
+            kwargs = {'trackfd': False} if sys.version_info >= (3, 13) else {}
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ, **kwargs)
+        else:
+            buf = bytearray(f.read())
+    if bytes(buf[: len(MAGIC)]) != MAGIC:
+        raise ValueError("%s is not a saved model" % path)
+    size, = struct.unpack('<Q', buf[len(MAGIC) : len(MAGIC) + 8])
+    return buf, json.loads(bytes(buf[len(MAGIC) + 8 : len(MAGIC) + 8 + size]).decode())
+
+
+def _model(path, buf, entry):
+    if entry['type'] not in MODELS:
+        raise ValueError("%s: unknown model type %s" % (path, entry['type']))
+    arrays = {}
+    for name, spec in entry['arrays'].items():
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape']))
+        arrays[name] = np.frombuffer(buf, dtype, count, spec['offset']).reshape(spec['shape'])
+    module, name = entry['type'].rsplit('.', 1)
+    return getattr(importlib.import_module(module), name).from_state(entry['attrs'], arrays)
+
+
+def save(model, path):
+    """Save fitted model to binary file.
+
+    Keyword arguments:
+    model -- fitted model of any class in MODELS
+    path -- file name
+
+    The file holds the model type, its attributes and its arrays in full
+    precision; arrays are stored raw at aligned offsets so load() can map
+    them without parsing.
+    """
+    _write(path, [_state(model)], lambda entries: entries[0])
+
+
+def save_all(models, path):
+    """Save several fitted models to one binary file.
+
+    Keyword arguments:
+    models -- dict name -> fitted model of any class in MODELS
+    path -- file name
+
+    load_all() maps the file once for all models, so thousands of models
+    cost one mapping and one file descriptor.
+    """
+    names = list(models)
+    _write(path, [_state(models[name]) for name in names], lambda entries: {'models': dict(zip(names, entries))})
+
+
+def load(path, memmap=True):
+    """Load model saved with save().
+
+    Keyword arguments:
+    path -- file name
+    memmap -- map arrays from the file read-only instead of reading them,
+              pages are then read on first access
+    """
+    buf, header = _open(path, memmap)
+    if 'models' in header:
+        raise ValueError("%s holds several models, load them with load_all" % path)
+    return _model(path, buf, header)
+
+
+def load_all(path, memmap=True):
+    """Load models saved with save_all(), return dict name -> model.
+
+    Keyword arguments:
+    path -- file name
+    memmap -- map arrays from the file read-only instead of reading them
+    """
+    buf, header = _open(path, memmap)
+    if 'models' not in header:
+        raise ValueError("%s holds one model, load it with load" % path)
+    return {name: _model(path, buf, entry) for name, entry in header['models'].items()}
@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+#-*- coding: UTF-8 -*-
+
+import math
+import numpy as np
+
+from . import instrument
+from .ppoly import restrict
+
+
+class Table:
+    """Fitted model tabulated on a uniform grid.
+
+    Values between grid points are interpolated linearly, so a query costs
+    one index computation and no segment search.
+    """
+    def __init__(self, model, max_error=1e-6, max_size=1 << 26):
+        """Tabulate fitted model.
+
+        Keyword arguments:
+        model -- fitted Spline, Bezier, CubicBSpline or approximation
+        max_error -- maximal deviation from the model
+        max_size -- maximal number of grid points
+
+        The step is chosen from the bound step ** 2 / 8 * max|f''| of linear
+        interpolation error, max|f''| is taken from the coefficients of
+        every segment.
+        """
+        pp = model.piecewise()
+        C, h = pp.C, np.diff(pp.breaks)
+        if C.ndim == 3:
+            h = h[:, np.newaxis]
+        # f'' = 2 C2 + 6 C3 t is linear on a segment, extremes are at the ends
+        d2 = max(np.max(np.abs(2 * C[:, 2])), np.max(np.abs(2 * C[:, 2] + 6 * C[:, 3] * h)))
+        self.x0 = pp.breaks[0]
+        self.x1 = pp.breaks[-1]
+        width = self.x1 - self.x0
+        size = 2 if d2 == 0 else int(math.ceil(width / math.sqrt(8 * max_error / d2))) + 1
+        if size > max_size:
+            raise ValueError("%d grid points needed for error %g, max_size is %d" % (size, max_error, max_size))
+        size = max(size, 2)
+        self.step = width / (size - 1)
+        self.values = pp.value(np.linspace(self.x0, self.x1, size))
+        # error bound of the chosen grid
+        self.error = self.step ** 2 / 8 * d2
+
+    def value(self, x):
+        """Compute value in given point or array of points.
+
+        Points must be in interval [x[0], ..., x[n]] of the model.
+        """
+        clock = instrument.start()
+        x = np.asarray(x, dtype=float)
+        u = (x - self.x0) / self.step
+        i = np.clip(u.astype(np.intp), 0, len(self.values) - 2)
+        w = u - i
+        if self.values.ndim == 2:
+            w = w[..., np.newaxis]
+        f = self.values[i] + w * (self.values[i + 1] - self.values[i])
+        instrument.lap(self, 'value.evaluate', clock, x.size)
+        return restrict(f, self.x0, self.x1, x)
@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+#-*- coding: UTF-8 -*-
+
+import collections
+import threading
+
+import numpy as np
+
+# factorizations kept by factorize(), in bytes
+CACHE_BYTES = 1 << 26
+
+
+class TDMA:
+    """Tridiagonal Matrix Algorithm with the matrix factorized once.
+
+    Solves a[i] x[i - 1] + b[i] x[i] + c[i] x[i + 1] = d[i]. The sweep
+    coefficients alpha and the pivots depend only on the matrix, so they
+    are computed here and reused for every right-hand side.
+    """
+    def __init__(self, a, b, c):
+        self.n = len(b)
+        a, b, c = (np.asarray(e, dtype=float).tolist() for e in (a, b, c))
+        alpha = [0.0] * self.n
+        m = [0.0] * self.n
+        for i in range(self.n):
+            m[i] = b[i] + a[i] * alpha[i]
+            if i < self.n - 1:
+                alpha[i + 1] = -c[i] / m[i]
+        self.a = np.array(a)
+        self.alpha = np.array(alpha)
+        self.m = np.array(m)
+
+    def nbytes(self):
+        """Return size of the factorization in bytes."""
+        return self.a.nbytes + self.alpha.nbytes + self.m.nbytes
+
+    def sweep(self, d):
+        """Forward sweep for right-hand side d.
+
+        Returns beta, x[i] = alpha[i + 1] * x[i + 1] + beta[i + 1].
+        """
+        d = np.asarray(d, dtype=float)
+        d = d.tolist() if d.ndim == 1 else list(d)
+        a, m = self.a.tolist(), self.m.tolist()
+        beta = [d[0] * 0.0] * self.n
+        for i in range(self.n - 1):
+            beta[i + 1] = (d[i] - a[i] * beta[i]) / m[i]
+        return np.array(beta)
+
+    def solve(self, d, beta=None):
+        """Solve the system for right-hand side d.
+
+        Keyword arguments:
+        d -- right-hand side, (n, ) or (n, k) for k systems solved in one sweep
+        beta -- result of sweep(d), if already known
+        """
+        if beta is None:
+            beta = self.sweep(d)
+        d = np.asarray(d, dtype=float)
+        d = d.tolist() if d.ndim == 1 else list(d)
+        beta = beta.tolist() if beta.ndim == 1 else list(beta)
+        a, alpha, m = self.a, self.alpha.tolist(), self.m
+        n = self.n
+        x = [0.0] * n
+        # explicit eval of last component
+        x[-1] = (d[-1] - a[-1] * beta[-1]) / m[-1]
+        for i in reversed(range(0, n - 1)):
+            x[i] = alpha[i + 1] * x[i + 1] + beta[i + 1]
+        return np.array(x)
+
+
+class CyclicTDMA:
+    """Cyclic tridiagonal system solved with Sherman-Morrison.
+
+    As TDMA with a[0] multiplying x[n - 1] and c[n - 1] multiplying x[0].
+    The matrix is a tridiagonal one plus u v^T, the tridiagonal part is
+    factorized once and solved for u once, so every right-hand side costs
+    one more tridiagonal solve.
+    """
+    def __init__(self, a, b, c):
+        n = len(b)
+        if n < 3:
+            raise ValueError("cyclic system needs at least 3 unknowns")
+        gamma = -b[0]
+        diagonal = np.array(b, dtype=float)
+        diagonal[0] -= gamma
+        diagonal[-1] -= a[0] * c[-1] / gamma
+        lower = np.array(a, dtype=float)
+        upper = np.array(c, dtype=float)
+        lower[0] = upper[-1] = 0.0
+        self.tdma = TDMA(lower, diagonal, upper)
+        u = np.zeros((n, ))
+        u[0] = gamma
+        u[-1] = c[-1]
+        # v = (1, 0, ..., 0, a[0] / gamma)
+        self.v = a[0] / gamma
+        self.z = self.tdma.solve(u)
+        self.denominator = 1 + self.z[0] + self.v * self.z[-1]
+
+    def nbytes(self):
+        """Return size of the factorization in bytes."""
+        return self.tdma.nbytes() + self.z.nbytes
+
+    def solve(self, d):
+        """Solve the system for right-hand side d, (n, ) or (n, k)."""
+        y = self.tdma.solve(d)
+        z = self.z if y.ndim == 1 else self.z[:, np.newaxis]
+        return y - z * ((y[0] + self.v * y[-1]) / self.denominator)
+
+
+_cache = collections.OrderedDict()
+_lock = threading.Lock()
+
+
+def factorize(a, b, c, cyclic=False, key=None):
+    """Return TDMA for the tridiagonal matrix with diagonals a, b, c.
+
+    Keyword arguments:
+    a, b, c -- diagonals
+    cyclic -- a[0] and c[n - 1] close the system cyclically, CyclicTDMA
+              is returned then
+    key -- hashable naming the matrix, e.g. ('spline', n) for a matrix
+           that depends only on the number of knots; the factorization
+           is cached under it, so series fitted on the same grid share
+           one. Matrices derived from the data are factorized every time.
+
+    Cached factorizations take at most CACHE_BYTES, the least recently
+    used ones are dropped first.
+    """
+    if key is None:
+        return CyclicTDMA(a, b, c) if cyclic else TDMA(a, b, c)
+    key = (key, cyclic)
+    with _lock:
+        tdma = _cache.get(key)
+        if tdma is not None:
+            _cache.move_to_end(key)
+            return tdma
+    tdma = CyclicTDMA(a, b, c) if cyclic else TDMA(a, b, c)
+    if tdma.nbytes() <= CACHE_BYTES:
+        with _lock:
+            _cache[key] = tdma
+            total = sum(e.nbytes() for e in _cache.values())
+            while total > CACHE_BYTES:
+                total -= _cache.popitem(last=False)[1].nbytes()
+    return tdma